@@ -0,0 +1,291 @@
+import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload, undefer_group
+from models import db, Venue, Artist, Show, DETAILS
+
+#----------------------------------------------------------------------------#
+# Past and upcoming show aggregates.
+#----------------------------------------------------------------------------#
+
+PENDING_KEY = 'show_aggregates_pending'
+RENAMED_KEY = 'show_aggregates_renamed'
+
+# Venue and artist columns copied into show summaries, and their keys there
+COPIED_FIELDS = {
+    Venue: (('name', 'venue_name'), ('image_link', 'venue_image_link')),
+    Artist: (('name', 'artist_name'), ('image_link', 'artist_image_link'))
+}
+
+
+def show_summary(show, venue, artist):
+    """
+    Returns the show details rendered on venue and artist pages
+    """
+    return dict(
+        show_id=show.id,
+        venue_id=venue.id,
+        venue_name=venue.name,
+        venue_image_link=venue.image_link,
+        artist_id=artist.id,
+        artist_name=artist.name,
+        artist_image_link=artist.image_link,
+        start_time=show.date
+        )
+
+
+def _sort_shows(entity):
+    entity.upcoming_shows = sorted(entity.upcoming_shows,
+                                   key=lambda show: show['start_time'])
+    entity.past_shows = sorted(entity.past_shows,
+                               key=lambda show: show['start_time'], reverse=True)
+    entity.upcoming_shows_count = len(entity.upcoming_shows)
+    entity.past_shows_count = len(entity.past_shows)
+
+
+def add_show(entity, summary, now):
+    """
+    Adds a show to the past or upcoming shows of a venue or artist
+    """
+    if summary['start_time'] < now:
+        entity.past_shows = (entity.past_shows or []) + [summary]
+        entity.upcoming_shows = entity.upcoming_shows or []
+    else:
+        entity.upcoming_shows = (entity.upcoming_shows or []) + [summary]
+        entity.past_shows = entity.past_shows or []
+    _sort_shows(entity)
+
+
+def remove_show(entity, show_id):
+    """
+    Removes a show from the past and upcoming shows of a venue or artist
+    """
+    entity.past_shows = [show for show in entity.past_shows or []
+                         if show['show_id'] != show_id]
+    entity.upcoming_shows = [show for show in entity.upcoming_shows or []
+                             if show['show_id'] != show_id]
+    _sort_shows(entity)
+
+
+def roll_over(entity, now):
+    """
+    Moves upcoming shows that have started into past shows.
+    Returns True if the entity was changed.
+    """
+    upcoming = entity.upcoming_shows or []
+    started = [show for show in upcoming if show['start_time'] < now]
+    if not started:
+        return False
+    entity.upcoming_shows = [show for show in upcoming if show['start_time'] >= now]
+    entity.past_shows = (entity.past_shows or []) + started
+    _sort_shows(entity)
+    return True
+
+
+def rename_shows(entity, id_key, entity_id, values):
+    """
+    Replaces the copied ``values`` in the shows of a venue or artist that
+    belong to the venue or artist ``entity_id``
+    """
+    def renamed(show):
+        return dict(show, **values) if show[id_key] == entity_id else show
+    entity.past_shows = [renamed(show) for show in entity.past_shows or []]
+    entity.upcoming_shows = [renamed(show) for show in entity.upcoming_shows or []]
+
+
+def _id(value):
+    # Shows built from form data may carry their ids as strings
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _load(session, model, ids):
+    ids = [entity_id for entity_id in ids if entity_id is not None]
+    if not ids:
+        return {}
+    entities = session.query(model).options(undefer_group(DETAILS))\
+        .filter(model.id.in_(ids)).all()
+    return dict((entity.id, entity) for entity in entities)
+
+
+def _chunks(ids, size):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+class ShowAggregates(object):
+    """
+    Keeps the past/upcoming show columns of venues and artists current.
+
+    Shows created or deleted in a session are applied to their venue and
+    artist within the same transaction, so profile pages render from the
+    stored columns instead of querying shows. Shows that start after being
+    listed are moved to past shows by the ``rollover-shows`` command, which
+    is meant to run on a schedule (e.g. hourly from cron). Renaming a
+    venue or artist, or changing its image, updates the copies in the
+    summaries of its shows the same way.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.batch_size = 500
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Method for binding the aggregates to a flask application
+        """
+        self.app = app
+        self.batch_size = app.config.get('SHOW_AGGREGATES_BATCH_SIZE',
+                                         self.batch_size)
+        event.listen(db.session, 'after_flush', self._after_flush)
+        event.listen(db.session, 'after_flush_postexec', self._after_flush_postexec)
+        event.listen(db.session, 'after_rollback', self._on_rollback)
+        app.cli.add_command(rollover_shows_command)
+        app.cli.add_command(rebuild_show_aggregates_command)
+        app.extensions['show_aggregates'] = self
+
+    def _after_flush(self, session, flush_context):
+        # The session still lists what was flushed, and new shows have ids.
+        pending = session.info.setdefault(PENDING_KEY, [])
+        for obj in session.new:
+            if isinstance(obj, Show):
+                pending.append((True, obj))
+        for obj in session.deleted:
+            if isinstance(obj, Show):
+                pending.append((False, obj))
+        if not pending:
+            session.info.pop(PENDING_KEY)
+        renamed = [obj for obj in session.dirty if type(obj) in COPIED_FIELDS and
+                   any(inspect(obj).attrs[column].history.has_changes()
+                       for column, _ in COPIED_FIELDS[type(obj)])]
+        if renamed:
+            session.info.setdefault(RENAMED_KEY, []).extend(renamed)
+
+    def _after_flush_postexec(self, session, flush_context):
+        # Changes made here are written by the next flush, which commit()
+        # runs before finishing the transaction.
+        for entity in session.info.pop(RENAMED_KEY, ()):
+            with session.no_autoflush:
+                self._refresh_copies(session, entity)
+        pending = session.info.pop(PENDING_KEY, None)
+        if not pending:
+            return
+        now = datetime.datetime.now()
+        with session.no_autoflush:
+            venues = _load(session, Venue, set(_id(show.venue_id) for _, show in pending))
+            artists = _load(session, Artist, set(_id(show.artist_id) for _, show in pending))
+            for created, show in pending:
+                venue = venues.get(_id(show.venue_id))
+                artist = artists.get(_id(show.artist_id))
+                if created:
+                    # Without both rows there is nothing to summarize; the
+                    # database rejects such a show when it checks the keys
+                    if venue is not None and artist is not None:
+                        summary = show_summary(show, venue, artist)
+                        add_show(venue, summary, now)
+                        add_show(artist, summary, now)
+                    continue
+                # A venue or artist deleted along with its shows is skipped
+                if venue is not None:
+                    remove_show(venue, show.id)
+                if artist is not None:
+                    remove_show(artist, show.id)
+
+    def _refresh_copies(self, session, entity):
+        # The venue's or artist's own shows and those of everyone it has
+        # shows with carry the copied values
+        model = type(entity)
+        values = dict((key, getattr(entity, column)) for column, key in COPIED_FIELDS[model])
+        if model is Venue:
+            other, column, other_column, id_key = Artist, Show.venue_id, Show.artist_id, 'venue_id'
+        else:
+            other, column, other_column, id_key = Venue, Show.artist_id, Show.venue_id, 'artist_id'
+        rename_shows(entity, id_key, entity.id, values)
+        ids = [row[0] for row in session.query(other_column).distinct()
+               .filter(column == entity.id)]
+        for chunk in _chunks(ids, self.batch_size):
+            for related in _load(session, other, chunk).values():
+                rename_shows(related, id_key, entity.id, values)
+        # Show rows keep a copy of the names and the artist image too
+        show_values = dict((key, value) for key, value in values.items()
+                           if hasattr(Show, key))
+        session.query(Show).filter(column == entity.id)\
+            .update(show_values, synchronize_session=False)
+
+    def _on_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
+        session.info.pop(RENAMED_KEY, None)
+
+    def rollover(self, now=None, since=None):
+        """
+        Method for moving shows that started between ``since`` and ``now``
+        from upcoming to past shows. ``since`` defaults to a day before
+        ``now`` so the job only looks at recently started shows.
+        """
+        now = now or datetime.datetime.now()
+        since = since or now - datetime.timedelta(days=1)
+        moved = 0
+        for model, column in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+            ids = [row[0] for row in db.session.query(column).distinct()
+                   .filter(Show.date >= since, Show.date < now)]
+            for chunk in _chunks(ids, self.batch_size):
+                entities = model.query.options(undefer_group(DETAILS))\
+                    .filter(model.id.in_(chunk))\
+                    .filter(model.upcoming_shows_count > 0).all()
+                moved += sum(1 for entity in entities if roll_over(entity, now))
+                db.session.commit()
+        return moved
+
+    def rebuild(self, now=None, venue_ids=None, artist_ids=None):
+        """
+        Method for recomputing venue and artist aggregates from the show
+        table, for the given ids only or for every venue and artist
+        """
+        now = now or datetime.datetime.now()
+        for model, column, only in ((Venue, Show.venue_id, venue_ids),
+                                    (Artist, Show.artist_id, artist_ids)):
+            ids = [row[0] for row in db.session.query(model.id)] if only is None else only
+            for chunk in _chunks(ids, self.batch_size):
+                entities = _load(db.session, model, chunk)
+                # Lists are built aside and assigned once, since in-place
+                # changes to pickled columns are not detected
+                summaries = dict((entity_id, ([], [])) for entity_id in entities)
+                shows = Show.query.filter(column.in_(chunk))\
+                    .options(joinedload(Show.Venue).load_only('id', 'name', 'image_link'),
+                             joinedload(Show.Artist).load_only('id', 'name', 'image_link'))
+                for show in shows:
+                    past, upcoming = summaries[getattr(show, column.key)]
+                    summary = show_summary(show, show.Venue, show.Artist)
+                    if summary['start_time'] < now:
+                        past.append(summary)
+                    else:
+                        upcoming.append(summary)
+                for entity_id, entity in entities.items():
+                    entity.past_shows, entity.upcoming_shows = summaries[entity_id]
+                    _sort_shows(entity)
+                db.session.commit()
+
+
+@click.command('rollover-shows')
+@click.option('--since', type=click.DateTime(), default=None,
+              help='Only look at shows that started after this time.')
+@with_appcontext
+def rollover_shows_command(since):
+    """Move shows that have started from upcoming to past shows."""
+    moved = current_app.extensions['show_aggregates'].rollover(since=since)
+    click.echo(f'{moved} venues and artists updated')
+
+
+@click.command('rebuild-show-aggregates')
+@with_appcontext
+def rebuild_show_aggregates_command():
+    """Recompute past and upcoming shows for every venue and artist."""
+    current_app.extensions['show_aggregates'].rebuild()
+    click.echo('Show aggregates rebuilt')
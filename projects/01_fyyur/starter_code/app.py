@@ -5,15 +5,22 @@ import json
 import dateutil.parser
 import babel
 import datetime
-from flask import Flask, render_template, request, jsonify, Response, flash, redirect, url_for, current_app as app
+from flask import Flask, render_template, request, jsonify, Response, flash, redirect, url_for, abort, make_response, session, current_app as app
 from flask_moment import Moment
 import logging
-from logging import Formatter, FileHandler
+from request_log import setup_logging
 from flask_wtf import Form
 from flask_migrate import Migrate
 from forms import *
-from models import db, Venue, Artist, Show
-from flask_whooshalchemyplus import index_all
+from sqlalchemy.orm import load_only, undefer_group
+from models import db, Venue, Artist, Show, DETAILS
+from search_index import SearchIndexer
+from queries import (list_shows, decode_cursor, keyset_page, venue_area, venue_areas,
+                     venue_bookings, venue_is_free)
+from aggregates import ShowAggregates
+from cache import FragmentCache
+from bulk_import import import_cli
+from suggest import SuggestIndex
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -22,6 +29,12 @@ moment = Moment(app)
 app.config.from_object('config')
 db.init_app(app)
 migrate = Migrate(app, db)
+search_indexer = SearchIndexer(app, models=[Venue, Artist])
+show_aggregates = ShowAggregates(app)
+fragment_cache = FragmentCache(app)
+fragment_cache.invalidate_on(Venue, 'venues', columns=['name', 'city', 'state'])
+app.cli.add_command(import_cli)
+suggest_index = SuggestIndex(app)
 
 #----------------------------------------------------------------------------#
 # Filters.
@@ -36,6 +49,86 @@ def format_datetime(value, format='medium'):
 
 app.jinja_env.filters['date'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def render_profile(model, entity_id, template, name):
+  """
+  Renders a venue or artist page. Pages are cached per entity and
+  updated_at stamp, so any write to the entity makes a fresh page, and
+  browsers revalidate them with ETag/Last-Modified.
+  """
+  stamp = db.session.query(model.updated_at).filter_by(id=entity_id).first()
+  if stamp is None:
+    abort(404)
+  stamp = stamp[0]
+  if '_flashes' in session:
+    # Pending messages are rendered into this page only, so skip caching
+    entity = model.query.options(undefer_group(DETAILS)).filter_by(id=entity_id).first()
+    return render_template(template, **{name: entity.__dict__})
+  key = (name, entity_id, stamp)
+  html = fragment_cache.get_or_render(key, lambda: render_template(
+    template, **{name: model.query.options(undefer_group(DETAILS))
+                 .filter_by(id=entity_id).first().__dict__}))
+  response = make_response(html)
+  response.set_etag(f'{name}-{entity_id}-{stamp:%Y%m%d%H%M%S%f}')
+  response.last_modified = stamp
+  response.cache_control.public = True
+  response.cache_control.no_cache = True
+  return response.make_conditional(request)
+
+def listing_cursors(model):
+  """
+  Returns the decoded after/before cursors in the query string, aborting
+  with 400 when either was not issued by this listing
+  """
+  try:
+    return tuple(decode_cursor(model, request.args[name])
+                 if request.args.get(name) else None
+                 for name in ('after', 'before'))
+  except ValueError:
+    abort(400)
+
+def listing_page(model, after=None, before=None, group_by=None):
+  """
+  Returns the page of venues or artists selected by the decoded cursors
+  """
+  return keyset_page(model, (model.id, model.name, model.city, model.state),
+                     after=after, before=before, group_by=group_by,
+                     per_page=app.config['LISTING_PER_PAGE'])
+
+def datetime_args(*names):
+  """
+  Returns the query string arguments ``names`` parsed as datetimes, or
+  None where missing. Raises ValueError naming the first argument that
+  is not a date and time or has a UTC offset, since show times are
+  stored as naive venue-local times.
+  """
+  values = []
+  for name in names:
+    value = request.args.get(name)
+    if not value:
+      values.append(None)
+      continue
+    try:
+      value = dateutil.parser.parse(value)
+    except (ValueError, OverflowError):
+      raise ValueError(f'{name} is not a valid date and time')
+    if value.tzinfo is not None:
+      raise ValueError(f'{name} must not have a UTC offset')
+    values.append(value)
+  return values
+
+def listing_json(page):
+  return jsonify({
+    'success': True,
+    'items': [dict(id=row.id, name=row.name, city=row.city, state=row.state)
+              for row in page.items],
+    'next_cursor': page.next_cursor,
+    'prev_cursor': page.prev_cursor
+  })
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -45,28 +138,47 @@ def index():
   return render_template('pages/home.html')
 
 
+#  Search
+#  ----------------------------------------------------------------
+
+@app.route('/search/suggest')
+def search_suggest():
+  # type-ahead suggestions for venue names, artist names and cities
+  limit = min(request.args.get('limit', 10, type=int), 50)
+  suggestions = suggest_index.suggest(request.args.get('q', ''), limit=limit)
+  for suggestion in suggestions:
+    if suggestion['type'] != 'city':
+      suggestion['url'] = url_for('show_' + suggestion['type'], **{
+        suggestion['type'] + '_id': suggestion['id']})
+  return jsonify({'success': True, 'suggestions': suggestions})
+
+
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
 def venues():
-  # fetch_venues = Venue.query.group_by("city", "state")
-  fetch_venues = db.session.query(Venue).group_by(Venue.id, Venue.state, Venue.city).all()
-  if not fetch_venues:
+  after, before = listing_cursors(Venue)
+  if request.args.get('format') == 'json':
+    return listing_json(listing_page(Venue, after, before, group_by=venue_area))
+
+  def render_directory():
+    page = listing_page(Venue, after, before, group_by=venue_area)
+    return render_template('pages/venue_areas.html',
+                           areas=venue_areas(page.items), page=page)
+
+  # Keyed on the decoded cursor so only real positions in the listing are cached
+  key = ('venues', 'before', before) if before else ('venues', 'after', after)
+  directory = fragment_cache.get_or_render(key, render_directory)
+  if not directory.strip():
     flash('There are no venues yet')
-    return render_template('pages/venues.html')
-  venue_array = []
-  venue_keys = ['id', 'name', 'city', 'state']
-  for venue in fetch_venues:
-    venue_info = [venue.id, venue.name, venue.city, venue.state]
-    venue_array.append(dict(zip(venue_keys, venue_info)))
-  return render_template('pages/venues.html', venues=venue_array)
+  return render_template('pages/venues.html', directory=directory)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  index_all(app)
   search_term=request.form.get('search_term', '')
-  result = Venue.query.whoosh_search(search_term).all()
+  result = Venue.query.whoosh_search(search_term)\
+    .options(load_only('id', 'name')).all()
   count = len(result)
   return render_template('pages/search_venues.html', results=result,
                          search_term=request.form.get('search_term', ''),
@@ -75,9 +187,31 @@ def search_venues():
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  venue = Venue.query.filter_by(id=venue_id).first()
-  data = venue.__dict__
-  return render_template('pages/show_venue.html', venue=data)
+  return render_profile(Venue, venue_id, 'pages/show_venue.html', 'venue')
+
+@app.route('/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+  # lists the shows booked at a venue between start and end
+  if not db.session.query(Venue.id).filter_by(id=venue_id).first():
+    abort(404)
+  try:
+    start, end = datetime_args('start', 'end')
+  except ValueError as error:
+    return jsonify({'success': False, 'message': str(error)}), 400
+  start = start or datetime.datetime.now()
+  end = end or start + datetime.timedelta(days=7)
+  if end <= start:
+    return jsonify({'success': False, 'message': 'end must be after start'}), 400
+  bookings = venue_bookings(venue_id, start, end)
+  return jsonify({
+    'venue_id': venue_id,
+    'start': start.isoformat(),
+    'end': end.isoformat(),
+    'available': not bookings,
+    'bookings': [dict(show_id=show.id, name=show.name,
+                      start_time=show.start_time.isoformat(),
+                      end_time=show.end_time.isoformat()) for show in bookings]
+    })
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -104,12 +238,10 @@ def create_venue_submission():
       seek_description=form.seek_description.data,
       image_link=form.image_link.data
       )
-    check_venue = Venue.query.filter_by(name=form.name.data).first()
-    if check_venue:
+    new_venue = Venue(**venue_data)
+    if not new_venue.save_unique():
       flash('A venue with that name already exists')
       return render_template('pages/home.html')
-    new_venue = Venue(**venue_data)
-    new_venue.save()
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   else:
     errors = form.errors
@@ -140,14 +272,16 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  artists_result = Artist.query.all()
-  return render_template('pages/artists.html', artists=artists_result)
+  page = listing_page(Artist, *listing_cursors(Artist))
+  if request.args.get('format') == 'json':
+    return listing_json(page)
+  return render_template('pages/artists.html', artists=page.items, page=page)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  index_all(app)
   search_term=request.form.get('search_term', '')
-  result = Artist.query.whoosh_search(search_term).all()
+  result = Artist.query.whoosh_search(search_term)\
+    .options(load_only('id', 'name')).all()
   count = len(result)
   return render_template('pages/search_artists.html', count=count, 
                          results=result, search_term=request.form.get('search_term', ''))
@@ -155,16 +289,14 @@ def search_artists():
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  artist = Artist.query.filter_by(id=artist_id).first()
-  data = artist.__dict__
-  return render_template('pages/show_artist.html', artist=data)
+  return render_profile(Artist, artist_id, 'pages/show_artist.html', 'artist')
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
-  artist = Artist.query.filter_by(id=artist_id).first()
+  artist = Artist.query.options(undefer_group(DETAILS)).filter_by(id=artist_id).first()
   artist = artist.__dict__
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
@@ -194,7 +326,7 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  venue = Venue.query.filter_by(id=venue_id).first()
+  venue = Venue.query.options(undefer_group(DETAILS)).filter_by(id=venue_id).first()
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
@@ -246,12 +378,10 @@ def create_artist_submission():
       seek_description=form.seek_description.data,
       image_link=form.image_link.data
       )
-    check_artist = Artist.query.filter_by(name=form.name.data).first()
-    if check_artist:
+    new_artist = Artist(**artist_data)
+    if not new_artist.save_unique():
       flash('Artist with that name already exists')
       return render_template('pages/home.html')
-    new_artist = Artist(**artist_data)
-    new_artist.save()
     flash('Artist ' + request.form['name'] + ' was successfully added!')
   else:
     errors = form.errors
@@ -266,17 +396,17 @@ def create_artist_submission():
 @app.route('/shows')
 def shows():
   # displays list of shows at /shows
-  today = datetime.date.today()
-  shows = db.session.query(Show).filter(Show.date >= today).all()
-  artist_data = []
-  venue_data = []
-  for show in shows:
-    artist_info = Artist.query.filter_by(id=show.artist_id).first()
-    venue_info = Venue.query.filter_by(id=show.venue_id).first()
-    artist_data.append(artist_info)
-    venue_data.append(venue_info)
-  return render_template('pages/shows.html', shows=shows,
-                         artists=artist_data, venues=venue_data)
+  try:
+    start, end = datetime_args('start', 'end')
+  except ValueError:
+    abort(400)
+  if start and end and end <= start:
+    abort(400)
+  page = request.args.get('page', 1, type=int)
+  pagination = list_shows(start=start, end=end, page=page,
+                          per_page=app.config['SHOWS_PER_PAGE'])
+  return render_template('pages/shows.html', shows=pagination.items,
+                         pagination=pagination)
 
 @app.route('/shows/create')
 def create_shows():
@@ -286,8 +416,10 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   form = ShowForm(csrf_enabled=True)
-  artist = Artist.query.filter_by(id=form.artist_id.data).first()
-  venue = Venue.query.filter_by(id=form.venue_id.data).first()
+  artist = Artist.query.filter_by(id=form.artist_id.data)\
+    .options(load_only('id', 'name', 'seeking_venue', 'image_link')).first()
+  venue = Venue.query.filter_by(id=form.venue_id.data)\
+    .options(load_only('id', 'name')).first()
   if not artist:
     flash(" Artist doesnot exist")
     return render_template('pages/home.html')
@@ -298,24 +430,26 @@ def create_show_submission():
     flash("Venue doesnot exists")
     return render_template('pages/home.html')
   if form.validate_on_submit():
+    start_time, end_time = form.show_times()
+    if not venue_is_free(venue.id, start_time, end_time):
+      flash('The venue is already booked at that time')
+      return render_template('pages/home.html')
     show_data = dict(
       name=form.name.data,
-      artist_id=form.artist_id.data,
+      artist_id=artist.id,
       artist_image_link=artist.image_link,
       artist_name=artist.name,
-      venue_id=form.venue_id.data,
+      venue_id=venue.id,
       venue_name=venue.name,
-      start_time=form.start_time.data,
-      end_time=form.end_time.data,
-      date=form.date.data,
+      start_time=start_time,
+      end_time=end_time,
+      date=start_time,
       show_fee=form.fee.data
       )
-    check_show = Show.query.filter_by(name=form.name.data, venue_id=form.venue_id.data).first()
-    if check_show:
+    new_show = Show(**show_data)
+    if not new_show.save_unique():
       flash('Show already exists already exists')
       return render_template('pages/home.html')
-    new_show = Show(**show_data)
-    new_show.save()
     flash('Show ' + request.form['name'] + ' was successfully added!')
   else:
     errors = form.errors
@@ -334,13 +468,7 @@ def server_error(error):
 
 
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    setup_logging(app)
     app.logger.info('errors')
 
 #----------------------------------------------------------------------------#
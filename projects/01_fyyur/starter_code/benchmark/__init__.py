@@ -0,0 +1,5 @@
+"""
+Seeds a database with synthetic venues, artists and shows and measures
+every route of the app against it. Run ``python -m benchmark --help``
+from the starter_code directory.
+"""
@@ -0,0 +1,92 @@
+import importlib
+import json
+import os
+import sys
+import click
+
+#----------------------------------------------------------------------------#
+# Command line.
+#----------------------------------------------------------------------------#
+
+database_option = click.option('--database', default=None,
+                               help='Database URL, BENCHMARK_DATABASE_URI by default.')
+
+
+def load_app(database):
+    """
+    Returns the app bound to the benchmark database and search index.
+    Both are opened while the app module is imported, so the settings it
+    reads from the environment are switched before that.
+    """
+    if 'app' in sys.modules:
+        raise click.UsageError('The app is already loaded with its own database.')
+    import config
+    os.environ['DATABASE_URL'] = database or config.BENCHMARK_DATABASE_URI
+    os.environ['WHOOSH_BASE'] = config.BENCHMARK_WHOOSH_BASE
+    importlib.reload(config)
+    from app import app
+    return app
+
+
+@click.group()
+def cli():
+    """Seed a benchmark database and measure every route against it."""
+
+
+@cli.command('seed')
+@database_option
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=4000, show_default=True)
+@click.option('--shows', default=40000, show_default=True)
+@click.option('--seed', 'seed_value', default=0, show_default=True,
+              help='Random seed, so the same data can be generated again.')
+@click.option('--batch-size', default=10000, show_default=True,
+              help='Rows inserted per transaction.')
+@click.option('--reindex/--no-reindex', default=True,
+              help='Rebuild search indexes and show aggregates afterwards.')
+@click.confirmation_option(prompt='This drops every table in the benchmark database. Continue?')
+def seed_command(database, venues, artists, shows, seed_value, batch_size, reindex):
+    """Replace the benchmark database with synthetic data."""
+    from benchmark.seed import seed
+    from bulk_import import refresh_derived_data
+    app = load_app(database)
+    with app.app_context():
+        seed(venues, artists, shows, seed=seed_value, batch_size=batch_size, echo=click.echo)
+        refresh_derived_data(reindex)
+
+
+@cli.command('run')
+@database_option
+@click.option('--requests', default=200, show_default=True, help='Measured requests per route.')
+@click.option('--warmup', default=10, show_default=True, help='Unmeasured requests per route.')
+@click.option('--writes/--no-writes', default=False,
+              help='Also drive the create, edit and delete routes.')
+@click.option('--seed', 'seed_value', default=0, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark.json',
+              show_default=True, help='File the results are written to.')
+def run_command(database, requests, warmup, writes, seed_value, output):
+    """Measure latency, queries per request and peak RSS per route."""
+    from benchmark.runner import run
+    app = load_app(database)
+    results = run(app, requests=requests, warmup=warmup, writes=writes,
+                  seed=seed_value, echo=click.echo)
+    with open(output, 'w') as target:
+        json.dump(results, target, indent=2, sort_keys=True)
+    if results['skipped']:
+        click.echo(f"Not benchmarked: {', '.join(results['skipped'])}")
+    click.echo(f"Peak RSS {results['peak_rss_mb']} MB, results written to {output}")
+
+
+@cli.command('compare')
+@click.argument('before', type=click.File())
+@click.argument('after', type=click.File())
+def compare_command(before, after):
+    """Compare two result files, e.g. from two commits."""
+    from benchmark.runner import compare
+    for endpoint, metric, old, new in compare(json.load(before), json.load(after)):
+        change = f'{(new - old) / old * 100:+.0f}%' if old and new is not None else ''
+        click.echo(f'{endpoint:28} {metric:20} {old!s:>10} -> {new!s:>10} {change}')
+
+
+if __name__ == '__main__':
+    cli()
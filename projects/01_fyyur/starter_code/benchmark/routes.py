@@ -0,0 +1,165 @@
+import collections
+import datetime
+import random
+import re
+import uuid
+from models import db, Venue, Artist
+from queries import encode_cursor
+
+#----------------------------------------------------------------------------#
+# Requests per route.
+#----------------------------------------------------------------------------#
+
+# Endpoints in the order they are driven. Writes run last so reads see
+# the seeded data only, and delete_venue runs after create_venue_submission
+# so it removes venues the benchmark added itself.
+READS = [
+    'index', 'search_suggest', 'venues', 'search_venues', 'show_venue',
+    'venue_availability', 'create_venue_form', 'artists', 'search_artists',
+    'show_artist', 'edit_artist', 'edit_venue', 'create_artist_form', 'shows',
+    'create_shows'
+]
+WRITES = [
+    'create_venue_submission', 'create_artist_submission', 'create_show_submission',
+    'edit_artist_submission', 'edit_venue_submission', 'delete_venue'
+]
+
+BENCHMARK_PREFIX = 'Benchmark'
+
+Request = collections.namedtuple('Request', ['method', 'path', 'data'])
+Row = collections.namedtuple('Row', ['id', 'name', 'city', 'state'])
+
+
+class Sampler(object):
+    """
+    Builds a request for an endpoint, e.g. ``sampler.show_venue()``, with
+    ids and search terms drawn from the seeded data. Returns None when the
+    endpoint cannot be driven, e.g. there is nothing left to delete.
+    """
+
+    def __init__(self, client, seed=0, pool_size=1000):
+        self.client = client
+        self.random = random.Random(seed)
+        self.venue_pool = self._sample(Venue, pool_size)
+        self.artist_pool = self._sample(Artist, pool_size)
+        self._csrf_token = None
+
+    def _sample(self, model, size):
+        rows = db.session.query(model.id, model.name, model.city, model.state)\
+            .order_by(db.func.random()).limit(size).all()
+        if not rows:
+            raise ValueError(f'No {model.__tablename__} rows, seed the database first')
+        return [Row(*row) for row in rows]
+
+    def csrf_token(self):
+        # One token serves the whole test client session
+        if self._csrf_token is None:
+            html = self.client.get('/venues/create').data.decode()
+            match = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', html)
+            self._csrf_token = match.group(1) if match else ''
+        return self._csrf_token
+
+    def form(self, **fields):
+        fields['csrf_token'] = self.csrf_token()
+        return fields
+
+    def venue(self):
+        return self.random.choice(self.venue_pool)
+
+    def artist(self):
+        return self.random.choice(self.artist_pool)
+
+    def index(self):
+        return Request('GET', '/', None)
+
+    def search_suggest(self):
+        name = self.random.choice([self.venue(), self.artist()]).name
+        return Request('GET', f'/search/suggest?q={name[:self.random.randint(1, 4)]}', None)
+
+    def _listing(self, endpoint, model, rows):
+        # Half the requests start from a random row to cover deep pages
+        if self.random.random() < 0.5:
+            return Request('GET', f'/{endpoint}', None)
+        row = self.random.choice(rows)
+        return Request('GET', f'/{endpoint}?after={encode_cursor(model, row)}', None)
+
+    def venues(self):
+        return self._listing('venues', Venue, self.venue_pool)
+
+    def artists(self):
+        return self._listing('artists', Artist, self.artist_pool)
+
+    def search_venues(self):
+        return Request('POST', '/venues/search', dict(search_term=self.venue().city))
+
+    def search_artists(self):
+        return Request('POST', '/artists/search', dict(search_term=self.artist().name))
+
+    def show_venue(self):
+        return Request('GET', f'/venues/{self.venue().id}', None)
+
+    def show_artist(self):
+        return Request('GET', f'/artists/{self.artist().id}', None)
+
+    def venue_availability(self):
+        start = datetime.date.today() + datetime.timedelta(days=self.random.randint(-30, 30))
+        return Request('GET', f'/venues/{self.venue().id}/availability?start={start}', None)
+
+    def edit_artist(self):
+        return Request('GET', f'/artists/{self.artist().id}/edit', None)
+
+    def edit_venue(self):
+        return Request('GET', f'/venues/{self.venue().id}/edit', None)
+
+    def create_venue_form(self):
+        return Request('GET', '/venues/create', None)
+
+    def create_artist_form(self):
+        return Request('GET', '/artists/create', None)
+
+    def create_shows(self):
+        return Request('GET', '/shows/create', None)
+
+    def shows(self):
+        return Request('GET', f'/shows?page={self.random.randint(1, 20)}', None)
+
+    def _venue_form(self, venue):
+        return self.form(name=venue.name, city=venue.city, state=venue.state,
+                         address='1 Main Street', genres='Jazz', phone='555-555-5555',
+                         facebook_link='https://www.facebook.com/benchmark')
+
+    def _artist_form(self, artist):
+        return self.form(name=artist.name, city=artist.city, state=artist.state,
+                         genres='Jazz', phone='555-555-5555', seeking_venue='y',
+                         website='https://benchmark.example.com',
+                         facebook_link='https://www.facebook.com/benchmark')
+
+    def create_venue_submission(self):
+        venue = self.venue()._replace(name=f'{BENCHMARK_PREFIX} Venue {uuid.uuid4().hex}')
+        return Request('POST', '/venues/create', self._venue_form(venue))
+
+    def create_artist_submission(self):
+        artist = self.artist()._replace(name=f'{BENCHMARK_PREFIX} Artist {uuid.uuid4().hex}')
+        return Request('POST', '/artists/create', self._artist_form(artist))
+
+    def create_show_submission(self):
+        return Request('POST', '/shows/create', self.form(
+            name=f'{BENCHMARK_PREFIX} Show {uuid.uuid4().hex}',
+            artist_id=self.artist().id, venue_id=self.venue().id,
+            start_time=f'{self.random.randint(1, 11)}am',
+            end_time=f'{self.random.randint(1, 11)}pm', fee='10.00'))
+
+    def edit_artist_submission(self):
+        artist = self.artist()
+        return Request('POST', f'/artists/{artist.id}/edit', self._artist_form(artist))
+
+    def edit_venue_submission(self):
+        venue = self.venue()
+        return Request('POST', f'/venues/{venue.id}/edit', self._venue_form(venue))
+
+    def delete_venue(self):
+        row = db.session.query(Venue.id)\
+            .filter(Venue.name.like(f'{BENCHMARK_PREFIX} Venue %')).first()
+        if row is None:
+            return None
+        return Request('DELETE', f'/venues/{row.id}/delete', None)
@@ -0,0 +1,144 @@
+import datetime
+import platform
+import resource
+import subprocess
+import sys
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import db, Venue, Artist, Show
+from benchmark.routes import READS, WRITES, Sampler
+
+#----------------------------------------------------------------------------#
+# Route benchmark.
+#----------------------------------------------------------------------------#
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of ``values``
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return round(peak / 1048576.0, 1)
+    return round(peak / 1024.0, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter(object):
+    """
+    Counts the statements sent to the database while it is listening
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'before_cursor_execute', self)
+
+
+def summarize(latencies, queries, statuses):
+    return dict(
+        requests=len(latencies),
+        p50_ms=percentile(latencies, 50),
+        p95_ms=percentile(latencies, 95),
+        p99_ms=percentile(latencies, 99),
+        max_ms=max(latencies) if latencies else None,
+        queries_per_request=round(sum(queries) / float(len(queries)), 2) if queries else None,
+        max_queries=max(queries) if queries else None,
+        status_codes=dict((str(code), statuses.count(code)) for code in sorted(set(statuses))),
+        peak_rss_mb=peak_rss_mb()
+        )
+
+
+def run(app, requests=200, warmup=10, writes=False, seed=0, echo=print):
+    """
+    Sends ``requests`` requests to every route through the Flask test
+    client and returns the results as a dict ready to be saved as JSON
+    """
+    # Measure the app as deployed, and count errors instead of raising them
+    app.debug = False
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    endpoints = READS + (WRITES if writes else [])
+    client = app.test_client()
+    with app.app_context():
+        sampler = Sampler(client, seed=seed)
+        volumes = dict(
+            venues=db.session.query(db.func.count(Venue.id)).scalar(),
+            artists=db.session.query(db.func.count(Artist.id)).scalar(),
+            shows=db.session.query(db.func.count(Show.id)).scalar()
+            )
+        database = db.engine.dialect.name
+        db.session.remove()
+    routes = {}
+    with QueryCounter() as counter:
+        for endpoint in endpoints:
+            latencies, queries, statuses = [], [], []
+            for number in range(warmup + requests):
+                with app.app_context():
+                    sample = getattr(sampler, endpoint)()
+                if sample is None:
+                    break
+                counter.count = 0
+                started = time.perf_counter()
+                response = client.open(sample.path, method=sample.method, data=sample.data)
+                elapsed = (time.perf_counter() - started) * 1000
+                if number < warmup:
+                    continue
+                latencies.append(round(elapsed, 3))
+                queries.append(counter.count)
+                statuses.append(response.status_code)
+            routes[endpoint] = summarize(latencies, queries, statuses)
+            echo(f"{endpoint:28} p50 {routes[endpoint]['p50_ms']} ms  "
+                 f"p95 {routes[endpoint]['p95_ms']} ms  "
+                 f"p99 {routes[endpoint]['p99_ms']} ms  "
+                 f"{routes[endpoint]['queries_per_request']} queries")
+    covered = set(endpoints)
+    return dict(
+        commit=git_commit(),
+        created_at=datetime.datetime.utcnow().isoformat(),
+        python=platform.python_version(),
+        database=database,
+        volumes=volumes,
+        settings=dict(requests=requests, warmup=warmup, writes=writes, seed=seed),
+        peak_rss_mb=peak_rss_mb(),
+        routes=routes,
+        skipped=sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                       if rule.endpoint not in covered and rule.endpoint != 'static')
+        )
+
+
+def compare(before, after):
+    """
+    Yields (endpoint, metric, before, after) for the latency and query
+    metrics of every route present in both results
+    """
+    for endpoint, result in sorted(after['routes'].items()):
+        previous = before['routes'].get(endpoint)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            yield endpoint, metric, previous.get(metric), result.get(metric)
@@ -0,0 +1,161 @@
+import datetime
+import decimal
+import random
+from constants import state_choices, genres_choices
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+
+# Rough shares of listings per state; states not listed get weight 1
+STATE_WEIGHTS = {
+    'CA': 39, 'TX': 29, 'FL': 22, 'NY': 20, 'PA': 13, 'IL': 13, 'OH': 12,
+    'GA': 11, 'NC': 10, 'MI': 10, 'NJ': 9, 'VA': 9, 'WA': 8, 'AZ': 7,
+    'MA': 7, 'TN': 7, 'IN': 7, 'MO': 6, 'MD': 6, 'WI': 6, 'CO': 6, 'MN': 6
+}
+
+GENRE_WEIGHTS = {
+    'Rock n Roll': 20, 'Pop': 18, 'Hip-Hop': 15, 'Electronic': 12, 'Alternative': 10,
+    'R&B': 8, 'Country': 8, 'Jazz': 6, 'Folk': 5, 'Punk': 4, 'Soul': 4,
+    'Blues': 3, 'Heavy Metal': 3, 'Reggae': 3, 'Funk': 2, 'Classical': 2,
+    'Instrumental': 2, 'Musical Theatre': 1, 'Other': 1
+}
+
+# Listings have one to three genres, mostly one
+GENRE_COUNT_WEIGHTS = [60, 30, 10]
+
+CITIES_PER_STATE = 20
+
+
+class Generator(object):
+    """
+    Builds rows for the venue, artist and show tables. The same seed
+    always yields the same data so runs can be compared.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.states = [state for state, _ in state_choices]
+        self.state_weights = [STATE_WEIGHTS.get(state, 1) for state in self.states]
+        self.genres = [genre for genre, _ in genres_choices]
+        self.genre_weights = [GENRE_WEIGHTS.get(genre, 1) for genre in self.genres]
+        # Cities within a state are Zipf distributed, so a few are busy
+        self.city_weights = [1.0 / rank for rank in range(1, CITIES_PER_STATE + 1)]
+
+    def place(self):
+        state = self.random.choices(self.states, self.state_weights)[0]
+        number = self.random.choices(range(1, CITIES_PER_STATE + 1), self.city_weights)[0]
+        return f'{state} City {number}', state
+
+    def pick_genres(self):
+        count = self.random.choices([1, 2, 3], GENRE_COUNT_WEIGHTS)[0]
+        picked = []
+        while len(picked) < count:
+            genre = self.random.choices(self.genres, self.genre_weights)[0]
+            if genre not in picked:
+                picked.append(genre)
+        return picked
+
+    def phone(self):
+        return '{}-{}-{}'.format(self.random.randint(200, 999),
+                                 self.random.randint(200, 999),
+                                 self.random.randint(1000, 9999))
+
+    def venue(self, number):
+        city, state = self.place()
+        seeking = self.random.random() < 0.3
+        return dict(
+            name=f'Venue {number}',
+            genres=self.pick_genres(),
+            address=f'{self.random.randint(1, 9999)} Main Street',
+            city=city,
+            state=state,
+            phone=self.phone(),
+            website=f'https://venue{number}.example.com',
+            facebook_link=f'https://www.facebook.com/venue{number}',
+            seeking_talent=seeking,
+            seek_description='Looking for local acts' if seeking else None,
+            image_link=f'https://images.example.com/venues/{number}.jpg',
+            past_shows=[],
+            upcoming_shows=[],
+            past_shows_count=0,
+            upcoming_shows_count=0
+            )
+
+    def artist(self, number):
+        city, state = self.place()
+        seeking = self.random.random() < 0.6
+        return dict(
+            name=f'Artist {number}',
+            genres=self.pick_genres(),
+            city=city,
+            state=state,
+            phone=self.phone(),
+            website=f'https://artist{number}.example.com',
+            facebook_link=f'https://www.facebook.com/artist{number}',
+            seeking_venue=seeking,
+            seek_description='Looking for shows' if seeking else None,
+            image_link=f'https://images.example.com/artists/{number}.jpg',
+            past_shows=[],
+            upcoming_shows=[],
+            past_shows_count=0,
+            upcoming_shows_count=0
+            )
+
+    def show(self, number, artist, venue, now):
+        # Shows are spread over the year before and after ``now``
+        day = now + datetime.timedelta(days=self.random.randint(-365, 365))
+        start_time = day.replace(hour=self.random.randint(17, 22), minute=0,
+                                 second=0, microsecond=0)
+        end_time = start_time + datetime.timedelta(hours=self.random.randint(1, 4))
+        return dict(
+            name=f'Show {number}',
+            artist_id=artist.id,
+            artist_name=artist.name,
+            artist_image_link=artist.image_link,
+            venue_id=venue.id,
+            venue_name=venue.name,
+            start_time=start_time,
+            end_time=end_time,
+            date=start_time,
+            show_fee=decimal.Decimal(self.random.randint(0, 20000)) / 100
+            )
+
+
+def _insert(model, rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(model.__table__.insert(), batch)
+            db.session.commit()
+            batch = []
+    if batch:
+        db.session.execute(model.__table__.insert(), batch)
+        db.session.commit()
+
+
+def seed(venues, artists, shows, seed=0, batch_size=10000, echo=print):
+    """
+    Drops and recreates every table, then inserts the given number of
+    venues, artists and shows
+    """
+    generator = Generator(seed)
+    db.drop_all()
+    db.create_all()
+    echo(f'Inserting {venues} venues')
+    _insert(Venue, (generator.venue(number) for number in range(1, venues + 1)), batch_size)
+    echo(f'Inserting {artists} artists')
+    _insert(Artist, (generator.artist(number) for number in range(1, artists + 1)), batch_size)
+    if not shows:
+        return
+    venue_rows = db.session.query(Venue.id, Venue.name).all()
+    artist_rows = db.session.query(Artist.id, Artist.name, Artist.image_link).all()
+    if not venue_rows or not artist_rows:
+        raise ValueError('Shows need at least one venue and one artist')
+    now = datetime.datetime.now()
+    echo(f'Inserting {shows} shows')
+    _insert(Show, (generator.show(number, generator.random.choice(artist_rows),
+                                  generator.random.choice(venue_rows), now)
+                   for number in range(1, shows + 1)), batch_size)
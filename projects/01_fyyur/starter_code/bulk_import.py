@@ -0,0 +1,320 @@
+import csv
+import json
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+import_cli = AppGroup('import', help='Bulk load venues, artists and shows.')
+
+# Columns holding several values; CSV files separate them with ';'
+LIST_FIELDS = ['genres']
+
+
+def read_rows(path, file_format=None):
+    """
+    Yields (line number, row dict) pairs from a CSV or NDJSON file
+    without reading the whole file into memory
+    """
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='') as source:
+        if file_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                for field in LIST_FIELDS:
+                    if row.get(field):
+                        row[field] = [value.strip() for value in row[field].split(';')]
+                yield reader.line_num, row
+        elif file_format in ('ndjson', 'jsonl'):
+            for line, text in enumerate(source, start=1):
+                if text.strip():
+                    yield line, json.loads(text)
+        else:
+            raise click.BadParameter(f'Unsupported file format {file_format}')
+
+
+def validate_row(form_class, row):
+    """
+    Validates a row with the same form used by the create pages.
+    Returns the form so its cleaned data can be read.
+    """
+    formdata = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            formdata.setlist(key, [str(item) for item in value])
+        elif isinstance(value, bool):
+            if value:
+                formdata.add(key, 'y')
+        elif value is not None:
+            formdata.add(key, str(value))
+    form = form_class(formdata=formdata, meta={'csrf': False})
+    form.validate()
+    return form
+
+
+def venue_values(form):
+    return dict(
+        name=form.name.data,
+        genres=list(form.genres.data),
+        address=form.address.data,
+        city=form.city.data,
+        state=form.state.data,
+        phone=form.phone.data,
+        website=form.website.data,
+        facebook_link=form.facebook_link.data,
+        seeking_talent=form.seeking_talent.data,
+        seek_description=form.seek_description.data,
+        image_link=form.image_link.data
+        )
+
+
+def artist_values(form):
+    return dict(
+        name=form.name.data,
+        genres=list(form.genres.data),
+        city=form.city.data,
+        state=form.state.data,
+        phone=form.phone.data,
+        website=form.website.data,
+        facebook_link=form.facebook_link.data,
+        seeking_venue=form.seeking_venue.data,
+        seek_description=form.seek_description.data,
+        image_link=form.image_link.data
+        )
+
+
+def show_values(form):
+    start_time, end_time = form.show_times()
+    return dict(
+        name=form.name.data,
+        artist_id=form.artist_id.data,
+        venue_id=form.venue_id.data,
+        start_time=start_time,
+        end_time=end_time,
+        date=start_time,
+        show_fee=form.fee.data
+        )
+
+
+class Importer(object):
+    """
+    Validates rows and inserts them in batches, one transaction per batch.
+    Batch inserts skip the ORM events that keep search indexes and show
+    aggregates up to date, so with ``reindex`` the importer updates them
+    for the inserted rows itself.
+    """
+
+    def __init__(self, model, form_class, values, batch_size, reindex=True):
+        self.model = model
+        self.form_class = form_class
+        self.values = values
+        self.batch_size = batch_size
+        self.reindex = reindex
+        self.inserted = 0
+        self.rejected = 0
+
+    def reject(self, line, message):
+        self.rejected += 1
+        click.echo(f'line {line}: {message}', err=True)
+
+    def run(self, rows):
+        batch = []
+        for line, row in rows:
+            form = validate_row(self.form_class, row)
+            if form.errors:
+                key, errors = next(iter(form.errors.items()))
+                self.reject(line, f'{key} => {errors[0]}')
+                continue
+            batch.append((line, self.values(form)))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        if self.reindex:
+            self.finish()
+
+    def flush(self, batch):
+        batch = self.prepare(batch)
+        if batch:
+            db.session.execute(self.model.__table__.insert(),
+                               [values for _, values in batch])
+            db.session.commit()
+            self.inserted += len(batch)
+            if self.reindex:
+                self.refresh(batch)
+
+    def refresh(self, batch):
+        """
+        Adds the rows of a committed batch to the search index, unless
+        search is disabled (WHOOSH_DISABLED)
+        """
+        search_indexer = current_app.extensions.get('search_indexer')
+        if search_indexer is None or self.model not in search_indexer.models.values():
+            return
+        names = [values['name'] for _, values in batch]
+        search_indexer.reindex(self.model, self.model.name.in_(names))
+
+    def finish(self):
+        """
+        Called once every batch is inserted
+        """
+
+    def prepare(self, batch):
+        """
+        Drops rows whose unique name is repeated in the batch or already
+        stored, using one query per batch
+        """
+        names = set(values['name'] for _, values in batch)
+        taken = set(row[0] for row in db.session.query(self.model.name)
+                    .filter(self.model.name.in_(names)))
+        prepared = []
+        for line, values in batch:
+            if values['name'] in taken:
+                self.reject(line, f"{values['name']} already exists")
+                continue
+            taken.add(values['name'])
+            prepared.append((line, values))
+        return prepared
+
+
+class ShowImporter(Importer):
+    """
+    Importer for shows, which also looks up the artist and venue of every
+    row in the batch with a single query per model, and drops rows whose
+    name is repeated at the same venue in the batch or already stored
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ShowImporter, self).__init__(*args, **kwargs)
+        self.venue_ids = set()
+        self.artist_ids = set()
+
+    def prepare(self, batch):
+        valid = []
+        for line, values in batch:
+            try:
+                values['artist_id'] = int(values['artist_id'])
+                values['venue_id'] = int(values['venue_id'])
+            except ValueError:
+                self.reject(line, 'artist_id and venue_id must be numbers')
+                continue
+            valid.append((line, values))
+        artist_ids = set(values['artist_id'] for _, values in valid)
+        venue_ids = set(values['venue_id'] for _, values in valid)
+        artists = dict((row.id, row) for row in db.session.query(
+            Artist.id, Artist.name, Artist.image_link, Artist.seeking_venue)
+            .filter(Artist.id.in_(artist_ids)))
+        venues = dict((row.id, row) for row in db.session.query(Venue.id, Venue.name)
+                      .filter(Venue.id.in_(venue_ids)))
+        names = set(values['name'] for _, values in valid)
+        # One duplicate would make the whole batch INSERT fail on uq_Show_name_venue_id
+        taken = set((row.name, row.venue_id) for row in db.session.query(Show.name, Show.venue_id)
+                    .filter(Show.name.in_(names), Show.venue_id.in_(venue_ids)))
+        prepared = []
+        for line, values in valid:
+            artist = artists.get(values['artist_id'])
+            venue = venues.get(values['venue_id'])
+            if not artist:
+                self.reject(line, 'Artist doesnot exist')
+                continue
+            if artist.seeking_venue is False:
+                self.reject(line, 'Artist not available')
+                continue
+            if not venue:
+                self.reject(line, 'Venue doesnot exist')
+                continue
+            if (values['name'], venue.id) in taken:
+                self.reject(line, f"Show {values['name']} already exists at this venue")
+                continue
+            taken.add((values['name'], venue.id))
+            values.update(
+                artist_name=artist.name,
+                artist_image_link=artist.image_link,
+                venue_name=venue.name
+                )
+            prepared.append((line, values))
+        return prepared
+
+    def refresh(self, batch):
+        # Aggregates are recomputed once at the end, so a venue or artist
+        # with shows in many batches is only read once
+        for _, values in batch:
+            self.venue_ids.add(values['venue_id'])
+            self.artist_ids.add(values['artist_id'])
+
+    def finish(self):
+        show_aggregates = current_app.extensions.get('show_aggregates')
+        if show_aggregates is not None:
+            show_aggregates.rebuild(venue_ids=self.venue_ids, artist_ids=self.artist_ids)
+
+
+def run_import(importer, path, file_format):
+    started = time.time()
+    importer.run(read_rows(path, file_format))
+    elapsed = max(time.time() - started, 1e-6)
+    click.echo(f'{importer.inserted} rows inserted, {importer.rejected} rejected '
+               f'in {elapsed:.1f}s ({importer.inserted / elapsed:.0f} rows/s)')
+    if not importer.reindex:
+        click.echo('Skipped updating search indexes and show aggregates')
+
+
+def refresh_derived_data(reindex):
+    """
+    Rebuilds every search index and show aggregate, for data loaded
+    without the ORM events, e.g. by the benchmark seeder
+    """
+    if not reindex:
+        click.echo('Skipped rebuilding search indexes and show aggregates')
+        return
+    search_indexer = current_app.extensions.get('search_indexer')
+    if search_indexer is not None:
+        search_indexer.rebuild()
+    current_app.extensions['show_aggregates'].rebuild()
+
+
+file_argument = click.argument('path', type=click.Path(exists=True, dir_okay=False))
+format_option = click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+                             help='File format, guessed from the extension by default.')
+batch_option = click.option('--batch-size', default=5000, show_default=True,
+                            help='Rows inserted per transaction.')
+reindex_option = click.option('--reindex/--no-reindex', default=True,
+                              help='Update search indexes and show aggregates for the new rows.')
+
+
+@import_cli.command('venues')
+@file_argument
+@format_option
+@batch_option
+@reindex_option
+def import_venues(path, file_format, batch_size, reindex):
+    """Import venues from a CSV or NDJSON file."""
+    run_import(Importer(Venue, VenueForm, venue_values, batch_size, reindex), path, file_format)
+
+
+@import_cli.command('artists')
+@file_argument
+@format_option
+@batch_option
+@reindex_option
+def import_artists(path, file_format, batch_size, reindex):
+    """Import artists from a CSV or NDJSON file."""
+    run_import(Importer(Artist, ArtistForm, artist_values, batch_size, reindex), path, file_format)
+
+
+@import_cli.command('shows')
+@file_argument
+@format_option
+@batch_option
+@reindex_option
+def import_shows(path, file_format, batch_size, reindex):
+    """Import shows from a CSV or NDJSON file."""
+    run_import(ShowImporter(Show, ShowForm, show_values, batch_size, reindex), path, file_format)
@@ -0,0 +1,117 @@
+import collections
+import threading
+import time
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from models import db
+
+#----------------------------------------------------------------------------#
+# Rendered fragment cache.
+#----------------------------------------------------------------------------#
+
+PENDING_KEY = 'fragment_cache_pending'
+
+
+class FragmentCache(object):
+    """
+    Process-local cache for rendered template fragments.
+
+    Keys are tuples whose first item is a namespace, e.g. ``('venues',)``.
+    A namespace is cleared when a transaction that wrote one of the models
+    it depends on commits. Entries also expire after a timeout so other
+    worker processes, which do not see this process' writes, catch up.
+    At most ``max_entries`` fragments are kept; the least recently used
+    one is dropped first.
+    """
+
+    def __init__(self, app=None):
+        self.timeout = 60
+        self.max_entries = 1000
+        self._entries = collections.OrderedDict()
+        self._dependencies = {}
+        self._lock = threading.Lock()
+        event.listen(db.session, 'after_commit', self._on_commit)
+        event.listen(db.session, 'after_rollback', self._on_rollback)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Method for binding the cache to a flask application
+        """
+        self.timeout = app.config.get('FRAGMENT_CACHE_TIMEOUT', self.timeout)
+        self.max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', self.max_entries)
+        app.extensions['fragment_cache'] = self
+
+    def invalidate_on(self, model, namespace, columns=None):
+        """
+        Method for clearing ``namespace`` whenever ``model`` is inserted or
+        deleted, or updated in one of ``columns`` (any column by default)
+        """
+        if model not in self._dependencies:
+            self._dependencies[model] = []
+            event.listen(model, 'after_insert', self._on_write)
+            event.listen(model, 'after_update', self._on_update)
+            event.listen(model, 'after_delete', self._on_write)
+        self._dependencies[model].append((namespace, columns))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        """
+        Returns the cached fragment for ``key``, calling ``render`` to
+        build and store it when missing
+        """
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.set(key, value)
+        return value
+
+    def clear(self, namespace):
+        with self._lock:
+            for key in [key for key in list(self._entries) if key[0] == namespace]:
+                self._entries.pop(key, None)
+
+    def _record(self, target, namespaces):
+        session = object_session(target)
+        if session is None or not namespaces:
+            return
+        session.info.setdefault(PENDING_KEY, set()).update(namespaces)
+
+    def _on_write(self, mapper, connection, target):
+        dependencies = self._dependencies[target.__class__]
+        self._record(target, [namespace for namespace, _ in dependencies])
+
+    def _on_update(self, mapper, connection, target):
+        state = inspect(target)
+        namespaces = []
+        for namespace, columns in self._dependencies[target.__class__]:
+            if columns is None or any(state.attrs[column].history.has_changes()
+                                      for column in columns):
+                namespaces.append(namespace)
+        self._record(target, namespaces)
+
+    def _on_commit(self, session):
+        for namespace in session.info.pop(PENDING_KEY, ()):
+            self.clear(namespace)
+
+    def _on_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
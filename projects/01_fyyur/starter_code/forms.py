@@ -1,9 +1,29 @@
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, DecimalField
+from wtforms.validators import DataRequired, InputRequired, NumberRange, AnyOf, URL, ValidationError
 from constants import state_choices, genres_choices
+import dateutil.parser
 import datetime
 
+
+def parse_time(value, day):
+    """
+    Parses a time such as 4pm or 16:30 into a datetime on ``day``
+    """
+    return dateutil.parser.parse(value, default=datetime.datetime(day.year, day.month, day.day))
+
+
+class TimeOfDay(object):
+    """
+    Validates that a field holds a time such as 4pm or 16:30
+    """
+    def __call__(self, form, field):
+        try:
+            dateutil.parser.parse(field.data)
+        except (ValueError, OverflowError):
+            raise ValidationError('Not a valid time')
+
+
 class ShowForm(Form):
     name = StringField(
         'name',
@@ -19,21 +39,33 @@ class ShowForm(Form):
     )
     start_time = StringField(
         'start_time',
-        validators=[DataRequired()]
+        validators=[DataRequired(), TimeOfDay()]
     )
     end_time = StringField(
         'end_time',
-        validators=[DataRequired()]
+        validators=[DataRequired(), TimeOfDay()]
     )
     date = DateTimeField(
         'date',
         default=datetime.date.today()
     )
-    fee = StringField(
+    fee = DecimalField(
         'fee',
-        validators=[DataRequired()]
+        places=2,
+        validators=[InputRequired(), NumberRange(min=0)]
     )
 
+    def show_times(self):
+        """
+        Returns the start and end of the show as datetimes on the show
+        date. An end time before the start time falls on the next day.
+        """
+        start = parse_time(self.start_time.data, self.date.data)
+        end = parse_time(self.end_time.data, self.date.data)
+        if end <= start:
+            end += datetime.timedelta(days=1)
+        return start, end
+
 class VenueForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -0,0 +1,29 @@
+"""list venues without a state or city
+
+Revision ID: d2a6f0c4b915
+Revises: 7b3e9d2c4f18
+Create Date: 2026-10-18 21:40:17.305921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6f0c4b915'
+down_revision = '7b3e9d2c4f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The directory orders and compares coalesce(state, ''), coalesce(city, '')
+    op.drop_index('ix_Venue_state_city_id', table_name='Venue')
+    op.create_index('ix_Venue_state_city_id', 'Venue',
+                    [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"), 'id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city_id', table_name='Venue')
+    op.create_index('ix_Venue_state_city_id', 'Venue', ['state', 'city', 'id'], unique=False)
@@ -0,0 +1,92 @@
+"""typed show times and fee
+
+Revision ID: f17c4d8e3a65
+Revises: e5a90b3c7d12
+Create Date: 2026-10-18 13:55:12.480317
+
+"""
+import datetime
+import decimal
+import logging
+from alembic import op
+import sqlalchemy as sa
+import dateutil.parser
+
+
+# revision identifiers, used by Alembic.
+revision = 'f17c4d8e3a65'
+down_revision = 'e5a90b3c7d12'
+branch_labels = None
+depends_on = None
+
+show = sa.table('Show',
+                sa.column('id', sa.Integer),
+                sa.column('date', sa.DateTime),
+                sa.column('start_time', sa.String),
+                sa.column('end_time', sa.String),
+                sa.column('show_fee', sa.String),
+                sa.column('start_at', sa.DateTime),
+                sa.column('end_at', sa.DateTime),
+                sa.column('fee', sa.Numeric(10, 2)))
+
+logger = logging.getLogger('alembic.env')
+
+
+def parse_time(show_id, value, day):
+    try:
+        return dateutil.parser.parse(value, default=day)
+    except (ValueError, OverflowError, TypeError):
+        logger.warning('Show %s: time %r is not a time, set to midnight', show_id, value)
+        return day
+
+
+def parse_fee(show_id, value):
+    try:
+        return decimal.Decimal(value.strip().lstrip('$'))
+    except (decimal.InvalidOperation, AttributeError):
+        logger.warning('Show %s: fee %r is not an amount, set to 0', show_id, value)
+        return decimal.Decimal(0)
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('start_at', sa.DateTime(), nullable=True))
+    op.add_column('Show', sa.Column('end_at', sa.DateTime(), nullable=True))
+    op.add_column('Show', sa.Column('fee', sa.Numeric(10, 2), nullable=True))
+
+    # Free-form values such as '4pm' are read as times on the show date.
+    # Values that cannot be read are logged with their show id to fix by hand.
+    connection = op.get_bind()
+    rows = connection.execute(sa.select([show.c.id, show.c.date, show.c.start_time,
+                                         show.c.end_time, show.c.show_fee])).fetchall()
+    for row in rows:
+        day = datetime.datetime(row.date.year, row.date.month, row.date.day)
+        start = parse_time(row.id, row.start_time, day)
+        end = parse_time(row.id, row.end_time, day)
+        if end <= start:
+            end += datetime.timedelta(days=1)
+        connection.execute(show.update().where(show.c.id == row.id).values(
+            start_at=start, end_at=end, fee=parse_fee(row.id, row.show_fee)))
+
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('start_time')
+        batch_op.drop_column('end_time')
+        batch_op.drop_column('show_fee')
+        batch_op.alter_column('start_at', new_column_name='start_time', nullable=False,
+                              existing_type=sa.DateTime())
+        batch_op.alter_column('end_at', new_column_name='end_time', nullable=False,
+                              existing_type=sa.DateTime())
+        batch_op.alter_column('fee', new_column_name='show_fee', nullable=False,
+                              existing_type=sa.Numeric(10, 2))
+    op.create_index('ix_Show_venue_id_start_time_end_time', 'Show',
+                    ['venue_id', 'start_time', 'end_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_venue_id_start_time_end_time', table_name='Show')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('start_time', type_=sa.String(length=120),
+                              existing_type=sa.DateTime(), existing_nullable=False)
+        batch_op.alter_column('end_time', type_=sa.String(length=120),
+                              existing_type=sa.DateTime(), existing_nullable=False)
+        batch_op.alter_column('show_fee', type_=sa.String(length=120),
+                              existing_type=sa.Numeric(10, 2), existing_nullable=False)
@@ -1,5 +1,8 @@
 # from app import app as app
+import datetime
+from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from flask import current_app as app
 from constants import searchable_fields
 import flask_whooshalchemyplus
@@ -10,6 +13,52 @@ import flask_whooshalchemyplus
 
 db = SQLAlchemy()
 
+UNIT_OF_WORK_KEY = 'unit_of_work_depth'
+
+# Deferred group of the venue and artist columns only profile pages show.
+# Listings select their columns, and profiles load the group with
+# undefer_group(DETAILS).
+DETAILS = 'details'
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Groups every save made inside the block into one transaction that is
+    committed when the outermost block exits, or rolled back if it raises.
+    Can also be used as a decorator.
+    """
+    session = db.session()
+    depth = session.info.get(UNIT_OF_WORK_KEY, 0)
+    session.info[UNIT_OF_WORK_KEY] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info[UNIT_OF_WORK_KEY] = depth
+
+
+def in_unit_of_work():
+    """
+    Returns True while a unit_of_work block is open in this session
+    """
+    return db.session().info.get(UNIT_OF_WORK_KEY, 0) > 0
+
+
+def is_unique_violation(error):
+    """
+    Returns True if an IntegrityError was raised by a unique constraint
+    """
+    orig = getattr(error, 'orig', None)
+    # psycopg2 reports SQLSTATE 23505, sqlite only has the message
+    return getattr(orig, 'pgcode', None) == '23505' or \
+        'UNIQUE constraint failed' in str(orig)
+
 
 class BaseModel(object):
     __searchable__ =  searchable_fields # indexed fields
@@ -19,8 +68,12 @@ class BaseModel(object):
     
     def save(self):
         """
-        Method for saving new data resource to the database
+        Method for saving new data resource to the database.
+        Inside a unit_of_work the commit is left to the enclosing block.
         """
+        if in_unit_of_work():
+            db.session.add(self)
+            return
         try:
             db.session.add(self)
             db.session.commit()
@@ -30,6 +83,62 @@ class BaseModel(object):
         finally:
             db.session.close()
 
+    def save_unique(self):
+        """
+        Method for saving a new data resource that may clash with an
+        existing row on a unique constraint. The INSERT itself detects the
+        clash, so no lookup query is needed and concurrent requests cannot
+        both succeed. Returns False if a matching row already exists.
+        """
+        session = db.session()
+        try:
+            if in_unit_of_work():
+                with session.begin_nested():
+                    session.add(self)
+                return True
+            session.add(self)
+            session.commit()
+            return True
+        except IntegrityError as error:
+            if not in_unit_of_work():
+                session.rollback()
+            if is_unique_violation(error):
+                return False
+            raise
+        finally:
+            if not in_unit_of_work():
+                session.close()
+
+    def edit(self):
+        """
+        Method for saving changes made to an existing data resource
+        """
+        if in_unit_of_work():
+            return
+        try:
+            db.session.commit()
+        except:
+            db.session.rollback()
+            error=True
+        finally:
+            db.session.close()
+
+    def delete(self):
+        """
+        Method for removing a data resource from the database
+        """
+        if in_unit_of_work():
+            db.session.delete(self)
+            return
+        try:
+            db.session.delete(self)
+            db.session.commit()
+        except:
+            db.session.rollback()
+            error=True
+        finally:
+            db.session.close()
+
 
 class Venue(db.Model, BaseModel):
     """
@@ -39,7 +148,7 @@ class Venue(db.Model, BaseModel):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
-    genres = db.Column(db.PickleType) # Array containing venue genres
+    genres = db.deferred(db.Column(db.PickleType), group=DETAILS) # Array containing venue genres
     address = db.Column(db.String(120))
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
@@ -47,18 +156,26 @@ class Venue(db.Model, BaseModel):
     website = db.Column(db.String(120))
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
-    seek_description = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    past_shows = db.Column(db.PickleType) # Array of dict objects for past shows
-    upcoming_shows = db.Column(db.PickleType) # Array dict objects for upcoming shows
+    seek_description = db.deferred(db.Column(db.String(120)), group=DETAILS)
+    image_link = db.deferred(db.Column(db.String(500)), group=DETAILS)
+    past_shows = db.deferred(db.Column(db.PickleType), group=DETAILS) # Array of dict objects for past shows
+    upcoming_shows = db.deferred(db.Column(db.PickleType), group=DETAILS) # Array dict objects for upcoming shows
     past_shows_count = db.Column(db.Integer, default=0)
     upcoming_shows_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow) # Bumped on every write
     venue_shows = db.relationship('Show', cascade='all, delete', backref='Venue', lazy=True)
 
     def __repr__(self):
         return f"<Venue obj: {self.name}>"
 
 
+# Serves the venue directory, which is ordered and paged by area. A venue
+# without a state or city is listed as if it were an empty string.
+db.Index('ix_Venue_state_city_id', db.func.coalesce(Venue.state, ''),
+         db.func.coalesce(Venue.city, ''), Venue.id)
+
+
 class Artist(db.Model, BaseModel):
     """
     Model class for creating and manipulating artist objects
@@ -67,19 +184,21 @@ class Artist(db.Model, BaseModel):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
-    genres = db.Column(db.PickleType) # Array containing genres
+    genres = db.deferred(db.Column(db.PickleType), group=DETAILS) # Array containing genres
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     website = db.Column(db.String(120))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
-    seek_description = db.Column(db.String(300))
-    image_link = db.Column(db.String(500))
-    past_shows = db.Column(db.PickleType) # Array of dict objects for past shows
-    upcoming_shows = db.Column(db.PickleType) # Array of dict objects for upcoming shows
+    seek_description = db.deferred(db.Column(db.String(300)), group=DETAILS)
+    image_link = db.deferred(db.Column(db.String(500)), group=DETAILS)
+    past_shows = db.deferred(db.Column(db.PickleType), group=DETAILS) # Array of dict objects for past shows
+    upcoming_shows = db.deferred(db.Column(db.PickleType), group=DETAILS) # Array of dict objects for upcoming shows
     past_shows_count = db.Column(db.Integer, default=0)
     upcoming_shows_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow) # Bumped on every write
     artist_shows = db.relationship('Show', cascade='all, delete', backref='Artist', lazy=True)
     
     def __repr__(self):
@@ -91,6 +210,11 @@ class Show(db.Model, BaseModel):
     Model class for creating and manipulating show objects
     """
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.UniqueConstraint('name', 'venue_id', name='uq_Show_name_venue_id'),
+        # Serves the overlap lookups behind venue availability and booking
+        db.Index('ix_Show_venue_id_start_time_end_time', 'venue_id', 'start_time', 'end_time'),
+        )
     __searchable__ = []
     
     id = db.Column(db.Integer, primary_key=True)
@@ -102,10 +226,10 @@ class Show(db.Model, BaseModel):
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'),
                          nullable=False)
     venue_name = db.Column(db.String(120))
-    date = db.Column(db.DateTime, nullable=False)
-    start_time = db.Column(db.String(120), nullable=False)
-    end_time = db.Column(db.String(120), nullable=False)
-    show_fee = db.Column(db.String(120), nullable=False)
+    date = db.Column(db.DateTime, nullable=False, index=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    show_fee = db.Column(db.Numeric(10, 2), nullable=False)
     
     def __repr__(self):
         return f"<Show obj: {self.name}>"
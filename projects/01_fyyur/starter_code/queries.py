@@ -0,0 +1,181 @@
+import base64
+import binascii
+import datetime
+import json
+from itertools import groupby
+from sqlalchemy import exists, func, literal_column, tuple_
+from sqlalchemy.orm import contains_eager
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Read queries.
+#----------------------------------------------------------------------------#
+
+
+def list_shows(start=None, end=None, page=1, per_page=30):
+    """
+    Returns a page of shows dated between ``start`` and ``end``, ordered by
+    date, with each show's artist and venue loaded in the same query.
+    ``start`` defaults to today so only upcoming shows are listed.
+    """
+    if start is None:
+        start = datetime.date.today()
+    query = Show.query\
+        .join(Show.Artist)\
+        .join(Show.Venue)\
+        .options(contains_eager(Show.Artist).load_only('id', 'name', 'image_link'),
+                 contains_eager(Show.Venue).load_only('id', 'name'))\
+        .filter(Show.date >= start)
+    if end is not None:
+        query = query.filter(Show.date < end)
+    return query.order_by(Show.date, Show.id)\
+        .paginate(page=page, per_page=per_page, error_out=False)
+
+
+class KeysetPage(object):
+    """
+    A page of rows plus the cursors of the pages before and after it.
+    A cursor is None when there is no page in that direction.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+# Column names each listing is ordered and paged by; the last one is unique.
+# Venues are listed by area, which the (state, city, id) index serves.
+LISTING_ORDER = {
+    Venue: ('state', 'city', 'id'),
+    Artist: ('name', 'id')
+}
+
+
+def _nullable(model, name):
+    return model.__table__.c[name].nullable
+
+
+def listing_order(model):
+    """
+    Returns the expressions a listing is ordered by. Row-value comparisons
+    are never true for NULLs, so nullable columns are read as empty
+    strings, matching the index on Venue. The empty string is written
+    inline since an index on an expression is not used for a bound one.
+    """
+    return [func.coalesce(getattr(model, name), literal_column("''")) if _nullable(model, name)
+            else getattr(model, name) for name in LISTING_ORDER[model]]
+
+
+def encode_cursor(model, row):
+    values = [getattr(row, name) for name in LISTING_ORDER[model]]
+    key = json.dumps(['' if value is None else value for value in values]).encode()
+    return base64.urlsafe_b64encode(key).decode().rstrip('=')
+
+
+def decode_cursor(model, cursor):
+    """
+    Returns the tuple of ordering values stored in a cursor, raising
+    ValueError if the cursor was not made by encode_cursor for ``model``
+    """
+    try:
+        key = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(key.decode())
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError(f'Invalid cursor {cursor}')
+    names = LISTING_ORDER[model]
+    if not isinstance(values, list) or len(values) != len(names):
+        raise ValueError(f'Invalid cursor {cursor}')
+    checked = []
+    for name, value in zip(names, values):
+        if value is None and _nullable(model, name):
+            value = ''
+        python_type = getattr(model, name).type.python_type
+        if type(value) is not python_type:
+            raise ValueError(f'Invalid cursor {cursor}')
+        checked.append(value)
+    return tuple(checked)
+
+
+def _trim_group(rows, boundary, group_by):
+    # Drops the trailing rows of the group that continues past the page,
+    # unless that group fills the whole page
+    kept = [row for row in rows if group_by(row) != group_by(boundary)]
+    return kept or rows
+
+
+def keyset_page(model, columns, after=None, before=None, per_page=50, group_by=None):
+    """
+    Returns a KeysetPage of ``columns`` in LISTING_ORDER, starting after
+    the ``after`` cursor values or ending before the ``before`` ones (see
+    decode_cursor). Each page seeks from its cursor, so it costs the same
+    however deep into the listing it is. With ``group_by``, a function of
+    a row, a page stops at a group boundary rather than splitting a group,
+    unless the group alone is larger than a page.
+    """
+    order = listing_order(model)
+    query = db.session.query(*columns)
+    if before is not None:
+        rows = query.filter(tuple_(*order) < tuple_(*before))\
+            .order_by(*[column.desc() for column in order])\
+            .limit(per_page + 1).all()
+        has_prev, has_next = len(rows) > per_page, True
+        page = rows[:per_page]
+        if has_prev and group_by is not None:
+            page = _trim_group(page, rows[per_page], group_by)
+        rows = page[::-1]
+    else:
+        if after is not None:
+            query = query.filter(tuple_(*order) > tuple_(*after))
+        rows = query.order_by(*order).limit(per_page + 1).all()
+        has_prev, has_next = after is not None, len(rows) > per_page
+        page = rows[:per_page]
+        if has_next and group_by is not None:
+            page = _trim_group(page, rows[per_page], group_by)
+        rows = page
+    if not rows:
+        return KeysetPage(rows)
+    return KeysetPage(rows,
+                      next_cursor=encode_cursor(model, rows[-1]) if has_next else None,
+                      prev_cursor=encode_cursor(model, rows[0]) if has_prev else None)
+
+
+def venue_area(row):
+    return (row.state, row.city)
+
+
+def venue_areas(venues):
+    """
+    Returns a page of venues, ordered by area, grouped by city and state
+    """
+    areas = []
+    for (state, city), rows in groupby(venues, key=venue_area):
+        areas.append(dict(
+            city=city,
+            state=state,
+            venues=[dict(id=venue.id, name=venue.name)
+                    for venue in sorted(rows, key=lambda row: row.name)]
+            ))
+    return areas
+
+
+def _overlapping(venue_id, start, end):
+    return db.and_(Show.venue_id == venue_id,
+                   Show.start_time < end,
+                   Show.end_time > start)
+
+
+def venue_bookings(venue_id, start, end):
+    """
+    Returns the shows booked at a venue that overlap ``start`` to ``end``
+    """
+    return db.session.query(Show.id, Show.name, Show.start_time, Show.end_time)\
+        .filter(_overlapping(venue_id, start, end))\
+        .order_by(Show.start_time).all()
+
+
+def venue_is_free(venue_id, start, end):
+    """
+    Returns True if no show at the venue overlaps ``start`` to ``end``
+    """
+    return not db.session.query(exists().where(_overlapping(venue_id, start, end))).scalar()
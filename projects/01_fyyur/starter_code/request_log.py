@@ -0,0 +1,102 @@
+import atexit
+import json
+import logging
+import queue
+import time
+from logging import Formatter
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Logging.
+#----------------------------------------------------------------------------#
+
+REQUEST_LOGGER = 'fyyur.requests'
+
+
+class LoggerNameFilter(logging.Filter):
+    """
+    Passes records from the request logger only, or everything else
+    """
+
+    def __init__(self, requests):
+        super(LoggerNameFilter, self).__init__()
+        self.requests = requests
+
+    def filter(self, record):
+        return (record.name == REQUEST_LOGGER) == self.requests
+
+
+def rotating_handler(app, filename):
+    """
+    Returns a file handler rotated by time if LOG_ROTATE_WHEN is set,
+    otherwise by size
+    """
+    if app.config.get('LOG_ROTATE_WHEN'):
+        return TimedRotatingFileHandler(filename, when=app.config['LOG_ROTATE_WHEN'],
+                                        backupCount=app.config.get('LOG_BACKUP_COUNT', 5))
+    return RotatingFileHandler(filename, maxBytes=app.config.get('LOG_MAX_BYTES', 10485760),
+                               backupCount=app.config.get('LOG_BACKUP_COUNT', 5))
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+
+
+def setup_logging(app):
+    """
+    Sends the app's log records through a queue to a single writer thread
+    that owns the rotating log files, so request threads never block on
+    file I/O. Every request also logs one JSON line with its route,
+    status, latency and number of database queries.
+    """
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setLevel(logging.INFO)
+
+    file_handler = rotating_handler(app, app.config.get('LOG_FILE', 'error.log'))
+    file_handler.setFormatter(
+        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    file_handler.addFilter(LoggerNameFilter(requests=False))
+    request_handler = rotating_handler(app, app.config.get('REQUEST_LOG_FILE', 'requests.log'))
+    request_handler.setFormatter(Formatter('%(message)s'))
+    request_handler.addFilter(LoggerNameFilter(requests=True))
+
+    listener = QueueListener(log_queue, file_handler, request_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.setLevel(logging.INFO)
+    app.logger.addHandler(queue_handler)
+    request_logger = logging.getLogger(REQUEST_LOGGER)
+    request_logger.setLevel(logging.INFO)
+    request_logger.propagate = False
+    request_logger.addHandler(queue_handler)
+
+    event.listen(Engine, 'before_cursor_execute', count_query)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+
+    @app.after_request
+    def log_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        request_logger.info(json.dumps(dict(
+            method=request.method,
+            route=request.url_rule.rule if request.url_rule else None,
+            path=request.path,
+            status=response.status_code,
+            latency_ms=round((time.perf_counter() - started) * 1000, 2),
+            db_queries=g.get('db_queries', 0)
+            )))
+        return response
+
+    return listener
@@ -0,0 +1,200 @@
+import atexit
+import queue
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from whoosh.writing import AsyncWriter, CLEAR
+from flask_whooshalchemyplus import whoosh_index
+from models import db
+
+#----------------------------------------------------------------------------#
+# Incremental search indexing.
+#----------------------------------------------------------------------------#
+
+PENDING_KEY = 'search_index_pending'
+
+
+class SearchIndexer(object):
+    """
+    Keeps the whoosh indexes of searchable models up to date.
+
+    Inserts, updates and deletes on the registered models are recorded
+    when the session flushes, handed over to a queue once the transaction
+    commits and written to the index in batches by a background thread,
+    so search requests only ever read the index.
+    """
+
+    def __init__(self, app=None, models=()):
+        self.app = None
+        self.models = {}
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        for model in models:
+            self.register(model)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Method for binding the indexer to a flask application
+        """
+        self.app = app
+        self.batch_size = app.config.get('SEARCH_INDEX_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('SEARCH_INDEX_FLUSH_INTERVAL',
+                                             self.flush_interval)
+        if app.config.get('WHOOSH_DISABLED') is True:
+            return
+        for model in self.models.values():
+            # Opens (or creates) the index and swaps in the whoosh query class
+            whoosh_index(app, model)
+        event.listen(db.session, 'after_commit', self._on_commit)
+        event.listen(db.session, 'after_rollback', self._on_rollback)
+        app.cli.add_command(rebuild_index_command)
+        app.extensions['search_indexer'] = self
+        atexit.register(self.flush)
+
+    def register(self, model):
+        """
+        Method for listening to write events on a searchable model
+        """
+        self.models[model.__name__] = model
+        event.listen(model, 'after_insert', self._on_write)
+        event.listen(model, 'after_update', self._on_write)
+        event.listen(model, 'after_delete', self._on_delete)
+
+    def _record(self, target, change):
+        session = object_session(target)
+        if session is None:
+            return
+        session.info.setdefault(PENDING_KEY, []).append(change)
+
+    def _on_write(self, mapper, connection, target):
+        # Values are copied at flush time because BaseModel.save() closes
+        # the session, after which the instance can no longer be loaded.
+        fields = dict((key, getattr(target, key)) for key in target.__searchable__)
+        self._record(target, (target.__class__.__name__, target.id, fields))
+
+    def _on_delete(self, mapper, connection, target):
+        self._record(target, (target.__class__.__name__, target.id, None))
+
+    def _on_commit(self, session):
+        pending = session.info.pop(PENDING_KEY, None)
+        if not pending:
+            return
+        for change in pending:
+            self._queue.put(change)
+        self._start_worker()
+
+    def _on_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
+
+    def _start_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run,
+                                                name='search-indexer')
+                self._worker.daemon = True
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self.apply(batch)
+            except Exception:
+                self.app.logger.exception('Search index update failed')
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def flush(self):
+        """
+        Method for applying every queued change immediately
+        """
+        batch = self._drain()
+        if batch:
+            self.apply(batch)
+
+    def apply(self, batch):
+        """
+        Method for writing a batch of queued changes to the indexes.
+        Only the latest change per record is written.
+        """
+        latest = {}
+        for model_name, pk, fields in batch:
+            latest.setdefault(model_name, {})[pk] = fields
+        for model_name, changes in latest.items():
+            model = self.models[model_name]
+            index = self.app.whoosh_indexes[model_name]
+            primary_field = model.whoosh_primary_key
+            with AsyncWriter(index) as writer:
+                for pk, fields in changes.items():
+                    if fields is None:
+                        writer.delete_by_term(primary_field, str(pk))
+                        continue
+                    document = dict((key, str(value)) for key, value in fields.items())
+                    document[primary_field] = str(pk)
+                    writer.update_document(**document)
+
+    def reindex(self, model, criterion):
+        """
+        Method for writing the rows of ``model`` matching ``criterion`` to
+        its index, for rows written without the ORM events, e.g. by a
+        batch insert
+        """
+        primary_field = model.whoosh_primary_key
+        searchable = model.__searchable__
+        columns = [getattr(model, primary_field)] + \
+            [getattr(model, key) for key in searchable]
+        self.apply([(model.__name__, row[0], dict(zip(searchable, row[1:])))
+                    for row in db.session.query(*columns).filter(criterion)])
+
+    def rebuild(self):
+        """
+        Method for rebuilding every registered index from the database
+        """
+        for model_name, model in self.models.items():
+            index = self.app.whoosh_indexes[model_name]
+            primary_field = model.whoosh_primary_key
+            searchable = model.__searchable__
+            columns = [getattr(model, primary_field)] + \
+                [getattr(model, key) for key in searchable]
+            writer = index.writer()
+            rows = db.session.query(*columns).yield_per(self.batch_size)
+            for row in rows:
+                document = dict((key, str(value)) for key, value
+                                in zip(searchable, row[1:]))
+                document[primary_field] = str(row[0])
+                writer.add_document(**document)
+            writer.commit(mergetype=CLEAR)
+            click.echo(f'{model_name} index rebuilt')
+
+
+@click.command('rebuild-index')
+@with_appcontext
+def rebuild_index_command():
+    """Rebuild the venue and artist search indexes from scratch."""
+    current_app.extensions['search_indexer'].rebuild()
@@ -0,0 +1,218 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import object_session
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Type-ahead suggestions.
+#----------------------------------------------------------------------------#
+
+PENDING_KEY = 'suggest_index_pending'
+KINDS = {Venue: 'venue', Artist: 'artist'}
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+class PrefixIndex(object):
+    """
+    Sorted list of (normalized text, kind, id, label) tuples with the
+    bookkeeping needed to update it one venue or artist at a time
+    """
+
+    def __init__(self, rows=()):
+        self.entries = []
+        self._keys = {}
+        self._cities = {}
+        self._sorted = False
+        for row in rows:
+            self.add(*row)
+        self.entries.sort()
+        self._sorted = True
+
+    def search(self, prefix, limit):
+        results = []
+        position = bisect_left(self.entries, (prefix,))
+        while position < len(self.entries) and len(results) < limit:
+            text, kind, entity_id, label = self.entries[position]
+            if not text.startswith(prefix):
+                break
+            results.append(dict(type=kind, id=entity_id, label=label))
+            position += 1
+        return results
+
+    def apply(self, kind, entity_id, values):
+        """
+        Replaces the entries of a venue or artist, or removes them if
+        ``values`` is None
+        """
+        self.remove(kind, entity_id)
+        if values is not None:
+            self.add(kind, entity_id, *values)
+
+    def add(self, kind, entity_id, name, city, state):
+        entry = (normalize(name), kind, entity_id, name)
+        self._insert(entry)
+        city_label = f'{city}, {state}' if state else city
+        self._keys[(kind, entity_id)] = (entry, city_label)
+        if city:
+            if city_label not in self._cities:
+                city_entry = (normalize(city), 'city', None, city_label)
+                self._insert(city_entry)
+                self._cities[city_label] = [city_entry, 0]
+            self._cities[city_label][1] += 1
+
+    def remove(self, kind, entity_id):
+        stored = self._keys.pop((kind, entity_id), None)
+        if stored is None:
+            return
+        entry, city_label = stored
+        self._discard(entry)
+        city = self._cities.get(city_label)
+        if city is None:
+            return
+        city[1] -= 1
+        if city[1] == 0:
+            del self._cities[city_label]
+            self._discard(city[0])
+
+    def _insert(self, entry):
+        if self._sorted:
+            insort(self.entries, entry)
+        else:
+            self.entries.append(entry)
+
+    def _discard(self, entry):
+        position = bisect_left(self.entries, entry)
+        if position < len(self.entries) and self.entries[position] == entry:
+            del self.entries[position]
+
+
+class SuggestIndex(object):
+    """
+    In-memory prefix index over venue names, artist names and cities.
+
+    A lookup is a binary search in a sorted list followed by a short scan.
+    The index is loaded on first use and then follows committed venue and
+    artist writes. Once older than a timeout it is rebuilt by a background
+    thread, to pick up writes made by other processes and by bulk imports,
+    which skip the ORM events; lookups keep using the old index until the
+    new one is swapped in.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.timeout = 300
+        self.loaded_at = 0
+        self._index = None
+        self._replay = None
+        self._lock = threading.Lock()
+        # Held while the index is being built, so only one build runs
+        self._load_lock = threading.Lock()
+        for model in KINDS:
+            event.listen(model, 'after_insert', self._on_write)
+            event.listen(model, 'after_update', self._on_write)
+            event.listen(model, 'after_delete', self._on_delete)
+        event.listen(db.session, 'after_commit', self._on_commit)
+        event.listen(db.session, 'after_rollback', self._on_rollback)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Method for binding the index to a flask application
+        """
+        self.app = app
+        self.timeout = app.config.get('SUGGEST_INDEX_TIMEOUT', self.timeout)
+        app.extensions['suggest_index'] = self
+
+    @property
+    def loaded(self):
+        return self._index is not None
+
+    def load(self):
+        """
+        Method for (re)building the index from the database. Writes
+        committed while it is built are applied before it is swapped in.
+        """
+        with self._lock:
+            self._replay = []
+        try:
+            rows = []
+            for model, kind in KINDS.items():
+                query = db.session.query(model.id, model.name, model.city, model.state)
+                rows.extend((kind, row.id, row.name, row.city, row.state) for row in query)
+            index = PrefixIndex(rows)
+            with self._lock:
+                for change in self._replay:
+                    index.apply(*change)
+                self._index = index
+                self.loaded_at = time.time()
+        finally:
+            with self._lock:
+                self._replay = None
+
+    def suggest(self, prefix, limit=10):
+        """
+        Returns up to ``limit`` entries whose text starts with ``prefix``
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+        elif time.time() - self.loaded_at > self.timeout:
+            self._start_reload()
+        with self._lock:
+            return self._index.search(prefix, limit)
+
+    def _start_reload(self):
+        if not self._load_lock.acquire(blocking=False):
+            return  # already being rebuilt
+        thread = threading.Thread(target=self._reload, name='suggest-index')
+        thread.daemon = True
+        thread.start()
+
+    def _reload(self):
+        try:
+            with self.app.app_context():
+                try:
+                    self.load()
+                except SQLAlchemyError:
+                    self.app.logger.exception('Rebuilding the suggest index failed')
+                finally:
+                    db.session.remove()
+        finally:
+            self._load_lock.release()
+
+    def _record(self, target, change):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(PENDING_KEY, []).append(change)
+
+    def _on_write(self, mapper, connection, target):
+        self._record(target, (KINDS[target.__class__], target.id,
+                              (target.name, target.city, target.state)))
+
+    def _on_delete(self, mapper, connection, target):
+        self._record(target, (KINDS[target.__class__], target.id, None))
+
+    def _on_commit(self, session):
+        pending = session.info.pop(PENDING_KEY, None)
+        if not pending:
+            return
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(pending)
+            if self._index is not None:
+                for change in pending:
+                    self._index.apply(*change)
+
+    def _on_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,414 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('WHOOSH_BASE', tempfile.mkdtemp())
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app, search_indexer, show_aggregates, suggest_index
+from cache import FragmentCache
+from request_log import REQUEST_LOGGER, count_query, setup_logging
+from models import db, Venue, Artist, Show
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Create the tables with one venue and one artist"""
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = app.test_client()
+        self.runner = app.test_cli_runner()
+        Venue(name='The Musical Hop', city='San Francisco', state='CA',
+              genres=['Jazz']).save()
+        Artist(name='Guns N Petals', city='San Francisco', state='CA',
+               genres=['Rock n Roll'], seeking_venue=True).save()
+        self.venue_id = Venue.query.first().id
+        self.artist_id = Artist.query.first().id
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def write_file(self, text, suffix):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as target:
+            target.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def eventually(self, check, timeout=5):
+        """Returns check() once it is true, or its last value after timeout"""
+        deadline = time.time() + timeout
+        while True:
+            result = check()
+            if result or time.time() > deadline:
+                return result
+            time.sleep(0.05)
+
+    def add_show(self, name, start):
+        Show(name=name, artist_id=self.artist_id, venue_id=self.venue_id,
+             date=start, start_time=start,
+             end_time=start + datetime.timedelta(hours=2), show_fee=10).save()
+        return Show.query.filter_by(name=name).first().id
+
+    def search(self, model, term):
+        # The index is written by a background thread after each commit
+        search_indexer.flush()
+        ids = [int(hit[model.whoosh_primary_key]) for hit in model.pure_whoosh(term)]
+        return [row.name for row in model.query.filter(model.id.in_(ids))]
+
+    def suggest(self, prefix):
+        response = self.client.get('/search/suggest?q=' + prefix)
+        return [item['label'] for item in response.get_json()['suggestions']]
+
+    def test_search_index_follows_writes(self):
+        search_indexer.rebuild()
+        self.assertEqual(self.search(Venue, 'Hop'), ['The Musical Hop'])
+        Venue(name='Park Square Live', city='San Francisco', state='CA',
+              genres=['Jazz']).save()
+        self.assertTrue(self.eventually(
+            lambda: self.search(Venue, 'Park') == ['Park Square Live']))
+        venue = Venue.query.filter_by(name='Park Square Live').first()
+        venue.name = 'Park Square Arena'
+        venue.edit()
+        self.assertTrue(self.eventually(
+            lambda: self.search(Venue, 'Arena') == ['Park Square Arena']))
+        self.assertTrue(self.eventually(lambda: not self.search(Venue, 'Live')))
+        Venue.query.filter_by(name='Park Square Arena').first().delete()
+        self.assertTrue(self.eventually(lambda: not self.search(Venue, 'Park')))
+        response = self.client.post('/artists/search', data={'search_term': 'petals'})
+        self.assertIn(b'Guns N Petals', response.data)
+
+    def test_show_aggregates_follow_created_and_deleted_shows(self):
+        now = datetime.datetime.now()
+        upcoming_id = self.add_show('Jazz Night', now + datetime.timedelta(days=1))
+        past_id = self.add_show('Rock Night', now - datetime.timedelta(days=1))
+        venue = Venue.query.get(self.venue_id)
+        self.assertEqual([show['show_id'] for show in venue.upcoming_shows], [upcoming_id])
+        self.assertEqual([show['show_id'] for show in venue.past_shows], [past_id])
+        self.assertEqual(venue.upcoming_shows[0]['artist_name'], 'Guns N Petals')
+        artist = Artist.query.get(self.artist_id)
+        self.assertEqual((artist.upcoming_shows_count, artist.past_shows_count), (1, 1))
+        Show.query.get(upcoming_id).delete()
+        venue = Venue.query.get(self.venue_id)
+        self.assertEqual((venue.upcoming_shows, venue.upcoming_shows_count), ([], 0))
+        self.assertEqual(len(Artist.query.get(self.artist_id).past_shows), 1)
+
+    def test_show_aggregates_follow_renamed_venues_and_artists(self):
+        show_id = self.add_show('Jazz Night', datetime.datetime.now() + datetime.timedelta(days=1))
+        venue = Venue.query.get(self.venue_id)
+        venue.name = 'The Musical Hall'
+        venue.image_link = 'https://example.com/hall.png'
+        venue.edit()
+        artist = Artist.query.get(self.artist_id)
+        artist.name = 'Guns N Roses'
+        artist.edit()
+        summary = Artist.query.get(self.artist_id).upcoming_shows[0]
+        self.assertEqual(summary['venue_name'], 'The Musical Hall')
+        self.assertEqual(summary['venue_image_link'], 'https://example.com/hall.png')
+        summary = Venue.query.get(self.venue_id).upcoming_shows[0]
+        self.assertEqual(summary['venue_name'], 'The Musical Hall')
+        self.assertEqual(summary['artist_name'], 'Guns N Roses')
+        show = Show.query.get(show_id)
+        self.assertEqual((show.venue_name, show.artist_name),
+                         ('The Musical Hall', 'Guns N Roses'))
+
+    def test_rollover_moves_started_shows_to_past_shows(self):
+        now = datetime.datetime.now()
+        show_id = self.add_show('Jazz Night', now - datetime.timedelta(hours=1))
+        # As if the show had been listed before it started
+        show_aggregates.rebuild(now=now - datetime.timedelta(hours=2))
+        self.assertEqual(Venue.query.get(self.venue_id).upcoming_shows_count, 1)
+        result = self.runner.invoke(args=['rollover-shows'])
+        self.assertIn('2 venues and artists updated', result.output)
+        for entity in (Venue.query.get(self.venue_id), Artist.query.get(self.artist_id)):
+            self.assertEqual(entity.upcoming_shows, [])
+            self.assertEqual([show['show_id'] for show in entity.past_shows], [show_id])
+        self.assertEqual(show_aggregates.rollover(), 0)
+
+    def test_profile_pages_answer_conditional_gets(self):
+        url = f'/venues/{self.venue_id}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        venue = Venue.query.get(self.venue_id)
+        venue.name = 'The Musical Hall'
+        venue.edit()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertIn(b'The Musical Hall', response.data)
+        response = self.client.get(f'/artists/{self.artist_id}')
+        self.assertIn(b'Guns N Petals', response.data)
+        self.assertEqual(self.client.get('/artists/999').status_code, 404)
+
+    def test_fragment_cache_drops_least_recently_used_entries(self):
+        cache = FragmentCache()
+        cache.max_entries = 2
+        cache.set(('venues', 1), 'one')
+        cache.set(('venues', 2), 'two')
+        cache.get(('venues', 1))
+        cache.set(('venues', 3), 'three')
+        self.assertEqual(cache.get(('venues', 1)), 'one')
+        self.assertIsNone(cache.get(('venues', 2)))
+        cache.clear('venues')
+        self.assertIsNone(cache.get(('venues', 3)))
+
+    def test_import_loads_venues_and_artists(self):
+        path = self.write_file(
+            'name,genres,address,city,state,phone,website,facebook_link,image_link\n'
+            'Park Square Live,Jazz;Blues,1 Main St,San Francisco,CA,,,'
+            'https://www.facebook.com/park,\n'
+            'The Musical Hop,Jazz,1 Main St,San Francisco,CA,,,'
+            'https://www.facebook.com/hop,\n'
+            'No Genres,,1 Main St,San Francisco,CA,,,https://www.facebook.com/none,\n', '.csv')
+        result = self.runner.invoke(args=['import', 'venues', path, '--batch-size', '1'])
+        self.assertIn('1 rows inserted, 2 rejected', result.output)
+        self.assertIn('The Musical Hop already exists', result.output)
+        venue = Venue.query.filter_by(name='Park Square Live').first()
+        self.assertEqual(venue.genres, ['Jazz', 'Blues'])
+        self.assertTrue(self.eventually(
+            lambda: self.search(Venue, 'Park') == ['Park Square Live']))
+        path = self.write_file(
+            '{"name": "Matt Quevedo", "genres": ["Jazz"], "city": "New York", '
+            '"state": "NY", "website": "https://matt.example.com", '
+            '"facebook_link": "https://www.facebook.com/matt", "seeking_venue": true}\n',
+            '.ndjson')
+        result = self.runner.invoke(args=['import', 'artists', path])
+        self.assertIn('1 rows inserted, 0 rejected', result.output)
+        self.assertTrue(Artist.query.filter_by(name='Matt Quevedo').first().seeking_venue)
+        self.assertEqual(self.search(Artist, 'Quevedo'), ['Matt Quevedo'])
+
+    def test_import_updates_aggregates_of_imported_shows(self):
+        path = self.write_file(
+            'name,artist_id,venue_id,start_time,end_time,date,fee\n'
+            f'Jazz Night,{self.artist_id},{self.venue_id},8pm,11pm,2030-01-01 00:00:00,10\n',
+            '.csv')
+        self.runner.invoke(args=['import', 'shows', path])
+        venue = Venue.query.get(self.venue_id)
+        self.assertEqual([show['artist_name'] for show in venue.upcoming_shows],
+                         ['Guns N Petals'])
+        self.assertEqual(Artist.query.get(self.artist_id).upcoming_shows_count, 1)
+
+    def test_import_works_with_search_disabled(self):
+        extension = app.extensions.pop('search_indexer')
+        self.addCleanup(app.extensions.__setitem__, 'search_indexer', extension)
+        path = self.write_file(
+            'name,genres,address,city,state,facebook_link\n'
+            'Park Square Live,Jazz,1 Main St,San Francisco,CA,https://www.facebook.com/park\n',
+            '.csv')
+        result = self.runner.invoke(args=['import', 'venues', path])
+        self.assertIsNone(result.exception)
+        self.assertIn('1 rows inserted', result.output)
+
+    def test_save_unique_rejects_duplicate_names(self):
+        self.assertFalse(Venue(name='The Musical Hop', city='Oakland', state='CA').save_unique())
+        self.assertTrue(Venue(name='Park Square Live', city='Oakland', state='CA').save_unique())
+        self.assertFalse(Artist(name='Guns N Petals').save_unique())
+        self.assertEqual(Venue.query.count(), 2)
+        self.assertEqual(Artist.query.count(), 1)
+
+    def test_import_skips_duplicate_shows(self):
+        row = f'{{name}},{self.artist_id},{self.venue_id},8pm,11pm,2030-01-01 00:00:00,10\n'
+        header = 'name,artist_id,venue_id,start_time,end_time,date,fee\n'
+        path = self.write_file(header + row.format(name='Jazz Night') +
+                               row.format(name='Jazz Night') +
+                               row.format(name='Rock Night'), '.csv')
+        result = self.runner.invoke(args=['import', 'shows', path, '--no-reindex'])
+        self.assertIn('2 rows inserted, 1 rejected', result.output)
+        path = self.write_file(header + row.format(name='Rock Night') +
+                               row.format(name='Blues Night'), '.csv')
+        result = self.runner.invoke(args=['import', 'shows', path, '--no-reindex'])
+        self.assertIn('1 rows inserted, 1 rejected', result.output)
+        self.assertEqual(Show.query.count(), 3)
+
+    def test_availability_rejects_utc_offsets(self):
+        url = f'/venues/{self.venue_id}/availability'
+        response = self.client.get(url + '?start=2030-01-01T10:00:00%2B00:00')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url + '?start=2030-01-01T10:00:00'
+                                   '&end=2030-01-02T10:00:00%2B00:00')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url + '?start=2030-01-01T10:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['available'])
+
+    def test_bad_date_ranges_are_rejected(self):
+        url = f'/venues/{self.venue_id}/availability'
+        response = self.client.get(url + '?start=next-ish')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['message'], 'start is not a valid date and time')
+        response = self.client.get(url + '?start=2030-01-02T10:00:00&end=2030-01-01T10:00:00')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/shows?end=soon').status_code, 400)
+        response = self.client.get('/shows?start=2030-01-02&end=2030-01-01')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/shows?start=2030-01-01').status_code, 200)
+
+    def test_venue_pages_keep_areas_whole(self):
+        app.config['LISTING_PER_PAGE'] = 3
+        self.addCleanup(app.config.__setitem__, 'LISTING_PER_PAGE', 50)
+        Venue(name='Park Square Live', city='San Francisco', state='CA',
+              genres=['Jazz']).save()
+        for name in ('The Dueling Pianos Bar', 'Blue Note', 'Village Vanguard'):
+            Venue(name=name, city='New York', state='NY', genres=['Jazz']).save()
+        first = self.client.get('/venues?format=json').get_json()
+        self.assertEqual([item['city'] for item in first['items']],
+                         ['San Francisco', 'San Francisco'])
+        second = self.client.get('/venues?format=json&after=' + first['next_cursor']).get_json()
+        self.assertEqual([item['city'] for item in second['items']], ['New York'] * 3)
+        self.assertIsNone(second['next_cursor'])
+        back = self.client.get('/venues?format=json&before=' + second['prev_cursor']).get_json()
+        self.assertEqual(back['items'], first['items'])
+        response = self.client.get('/venues?after=' + second['prev_cursor'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_venue_pages_list_venues_without_an_area(self):
+        app.config['LISTING_PER_PAGE'] = 1
+        self.addCleanup(app.config.__setitem__, 'LISTING_PER_PAGE', 50)
+        # Rows saved before city and state were required
+        db.session.execute(Venue.__table__.insert(), [
+            dict(name='Cityless Hall', state='CA', city=None),
+            dict(name='Nowhere Club', state=None, city=None)])
+        db.session.commit()
+        names, pages, cursor = [], [], ''
+        while cursor is not None:
+            page = self.client.get('/venues?format=json&after=' + cursor).get_json()
+            names.extend(item['name'] for item in page['items'])
+            pages.append(page)
+            cursor = page['next_cursor']
+        self.assertEqual(names, ['Nowhere Club', 'Cityless Hall', 'The Musical Hop'])
+        back = self.client.get('/venues?format=json&before=' + pages[2]['prev_cursor']).get_json()
+        self.assertEqual(back['items'], pages[1]['items'])
+        back = self.client.get('/venues?format=json&before=' + back['prev_cursor']).get_json()
+        self.assertEqual(back['items'], pages[0]['items'])
+        self.assertEqual(self.client.get('/venues').status_code, 200)
+
+    def test_listings_leave_profile_columns_unloaded(self):
+        self.add_show('Jazz Night', datetime.datetime.now() + datetime.timedelta(days=1))
+        search_indexer.rebuild()
+        search_indexer.flush()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', record)
+        for url in ('/venues', '/venues?format=json', '/artists', '/artists?format=json'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post('/venues/search', data={'search_term': 'hop'})
+        self.assertIn(b'The Musical Hop', response.data)
+        response = self.client.post('/artists/search', data={'search_term': 'petals'})
+        self.assertIn(b'Guns N Petals', response.data)
+        selects = [statement for statement in statements if statement.startswith('SELECT')]
+        self.assertTrue(selects)
+        details = re.compile(r'\.(genres|seek_description|image_link|past_shows|upcoming_shows)\b')
+        self.assertEqual([statement for statement in selects if details.search(statement)], [])
+
+    def test_listings_reject_invalid_cursors(self):
+        artists = self.client.get('/artists?format=json').get_json()
+        self.assertEqual(len(artists['items']), 1)
+        for cursor in ('not-a-cursor', 'WyJDQSJd', 'WyJDQSIsIlNhbiBGcmFuY2lzY28iLCIxIl0'):
+            response = self.client.get('/venues?after=' + cursor)
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/artists?before=WyJDQSIsIlNhbiBGcmFuY2lzY28iLDFd')
+        self.assertEqual(response.status_code, 400)
+
+    def test_suggestions_pick_up_rows_written_outside_the_orm(self):
+        suggest_index.load()
+        db.session.execute(Artist.__table__.insert(), [dict(
+            name='Matt Quevedo', city='New York', state='NY', seeking_venue=True)])
+        db.session.commit()
+        self.assertEqual(self.suggest('guns'), ['Guns N Petals'])
+        self.assertEqual(self.suggest('matt'), [])
+        # A stale index keeps answering while it is rebuilt in the background
+        suggest_index.loaded_at = 0
+        self.assertEqual(self.suggest('guns'), ['Guns N Petals'])
+        self.assertEqual(self.eventually(lambda: self.suggest('matt')), ['Matt Quevedo'])
+
+    def test_benchmark_seed_leaves_the_app_index_alone(self):
+        search_indexer.rebuild()
+        search_indexer.flush()
+
+        def index_files():
+            base = app.config['WHOOSH_BASE']
+            return sorted((name, os.path.getmtime(os.path.join(base, model, name)))
+                          for model in os.listdir(base)
+                          for name in os.listdir(os.path.join(base, model)))
+
+        before = index_files()
+        benchmark_base = tempfile.mkdtemp()
+        database = self.write_file('', '.db')
+        env = dict(os.environ, BENCHMARK_WHOOSH_BASE=benchmark_base)
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmark', 'seed', '--database', 'sqlite:///' + database,
+             '--venues', '3', '--artists', '3', '--shows', '5', '--yes'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        self.assertIn('Venue index rebuilt', result.stdout)
+        self.assertEqual(sorted(os.listdir(benchmark_base)), ['Artist', 'Venue'])
+        self.assertEqual(index_files(), before)
+        self.assertEqual(self.search(Venue, 'Hop'), ['The Musical Hop'])
+
+    def test_logs_are_written_through_the_queue(self):
+        log_dir = tempfile.mkdtemp()
+        logged = Flask('logged')
+        logged.config.update(SQLALCHEMY_DATABASE_URI='sqlite://',
+                             SQLALCHEMY_TRACK_MODIFICATIONS=False,
+                             LOG_FILE=os.path.join(log_dir, 'error.log'),
+                             REQUEST_LOG_FILE=os.path.join(log_dir, 'requests.log'))
+        db.init_app(logged)
+
+        @logged.route('/ping')
+        def ping():
+            db.session.execute('SELECT 1')
+            logged.logger.warning('pinged')
+            return 'pong'
+
+        listener = setup_logging(logged)
+        request_logger = logging.getLogger(REQUEST_LOGGER)
+        self.addCleanup(request_logger.handlers.clear)
+        self.addCleanup(event.remove, Engine, 'before_cursor_execute', count_query)
+        with logged.app_context():
+            self.assertEqual(logged.test_client().get('/ping').data, b'pong')
+        listener.stop()
+        atexit.unregister(listener.stop)
+
+        with open(logged.config['REQUEST_LOG_FILE']) as source:
+            lines = [json.loads(line) for line in source]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(dict((key, lines[0][key]) for key in
+                              ('method', 'route', 'path', 'status', 'db_queries')),
+                         dict(method='GET', route='/ping', path='/ping', status=200,
+                              db_queries=1))
+        with open(logged.config['LOG_FILE']) as source:
+            errors = source.read()
+        self.assertIn('WARNING: pinged', errors)
+        self.assertNotIn('"route"', errors)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
+
@@ -0,0 +1,133 @@
+import csv
+import json
+
+from models import db, data_version, Question, Category
+from cache import question_count, category_cache
+from quiz import quiz_deck
+
+FIELDS = ['question', 'answer', 'category', 'difficulty']
+BATCH_SIZE = 5000
+
+
+def read_rows(lines, file_format):
+    """
+    Yields (line number, row dict) pairs from an iterable of NDJSON or
+    CSV text lines, without reading them all into memory
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'ndjson':
+        for line, text in enumerate(lines, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError:
+                    yield line, None
+    else:
+        raise ValueError('Unsupported format {}'.format(file_format))
+
+
+def validate_row(row, category_ids):
+    """
+    Returns the values to insert for a row, or raises ValueError with
+    the reason it was rejected
+    """
+    if not isinstance(row, dict):
+        raise ValueError('row is not a JSON object')
+    for key in FIELDS:
+        if not row.get(key) and row.get(key) != 0:
+            raise ValueError('{} field is missing a value'.format(key))
+    try:
+        difficulty = int(row['difficulty'])
+        category = int(row['category'])
+    except (TypeError, ValueError):
+        raise ValueError('category and difficulty must be numbers')
+    if category not in category_ids:
+        raise ValueError('category {} does not exist'.format(category))
+    return {'question': str(row['question']).strip(),
+            'answer': str(row['answer']).strip(),
+            'category': category,
+            'difficulty': difficulty}
+
+
+class Importer(object):
+    """
+    Validates question rows and inserts them in batches, one transaction
+    per batch, skipping questions whose text is already in the bank
+    """
+    def __init__(self, batch_size=BATCH_SIZE, max_errors=100):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []
+        self.category_ids = set(row[0] for row in
+                                db.session.query(Category.id))
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'message': message})
+
+    def run(self, rows):
+        batch = []
+        try:
+            for line, row in rows:
+                try:
+                    batch.append(validate_row(row, self.category_ids))
+                except ValueError as error:
+                    self.reject(line, str(error))
+                    continue
+                if len(batch) >= self.batch_size:
+                    self.flush(batch)
+                    batch = []
+            if batch:
+                self.flush(batch)
+        finally:
+            if self.inserted:
+                # Batch inserts skip the BaseModel change callbacks
+                data_version.bump()
+                question_count.clear()
+                category_cache.invalidate()
+                quiz_deck.reset()
+        return self
+
+    def flush(self, batch):
+        texts = set(values['question'] for values in batch)
+        taken = set(row[0] for row in db.session.query(Question.question)
+                    .filter(Question.question.in_(texts)))
+        rows = []
+        for values in batch:
+            if values['question'] in taken:
+                self.duplicates += 1
+                continue
+            taken.add(values['question'])
+            rows.append(values)
+        if rows:
+            db.session.execute(Question.__table__.insert(), rows)
+            db.session.commit()
+            self.inserted += len(rows)
+
+    def summary(self):
+        return {'inserted': self.inserted, 'duplicates': self.duplicates,
+                'rejected': self.rejected, 'errors': self.errors}
+
+
+def export_questions(batch_size=1000):
+    """
+    Yields every question as a line of NDJSON, reading the table in
+    batches ordered by id
+    """
+    last_id = 0
+    while True:
+        questions = Question.query.filter(Question.id > last_id)\
+            .order_by(Question.id).limit(batch_size).all()
+        if not questions:
+            return
+        for question in questions:
+            yield json.dumps(question.format()) + '\n'
+        last_id = questions[-1].id
+        db.session.expunge_all()
@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from sqlalchemy.sql.expression import func
+
+from models import db, Question, Category
+
+
+class RowCount(object):
+    """
+    Cached row count of a model.
+    Inserts and deletes made through BaseModel adjust the count in place;
+    it is read again from the database once it is older than ``ttl``
+    seconds, which picks up writes made by other processes.
+    """
+    def __init__(self, model, ttl=60):
+        self.model = model
+        self.ttl = ttl
+        self.value = None
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+        model.on_change(self.adjust)
+
+    def get(self):
+        with self.lock:
+            if self.value is None or time.time() - self.loaded_at > self.ttl:
+                self.value = db.session.query(func.count(self.model.id))\
+                    .scalar()
+                self.loaded_at = time.time()
+            return self.value
+
+    def adjust(self, obj, action):
+        with self.lock:
+            if self.value is None:
+                return
+            if action == 'insert':
+                self.value += 1
+            elif action == 'delete':
+                self.value -= 1
+
+    def clear(self):
+        with self.lock:
+            self.value = None
+
+
+class CategoryCache(object):
+    """
+    Process-local copy of the category list, with the number of
+    questions in each category, kept both formatted and as the
+    serialized body of GET /api/categories.
+    Category writes made through BaseModel clear it; question inserts
+    and deletes adjust the counts in place, other question writes clear
+    it. It is also reloaded once it is older than ``ttl`` seconds.
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.entry = None
+        self.lock = threading.Lock()
+        Category.on_change(self.invalidate)
+        Question.on_change(self.count_question)
+
+    def _serialize(self, categories, loaded_at):
+        return (categories, json.dumps({'categories': categories}),
+                loaded_at)
+
+    def load(self):
+        with self.lock:
+            if self.entry is None or time.time() - self.entry[2] > self.ttl:
+                rows = db.session.query(Category, func.count(Question.id))\
+                    .outerjoin(Question, Question.category == Category.id)\
+                    .group_by(Category.id).order_by(Category.id).all()
+                categories = []
+                for category, count in rows:
+                    category = category.format()
+                    category['question_count'] = count
+                    categories.append(category)
+                self.entry = self._serialize(categories, time.time())
+            return self.entry
+
+    def categories(self):
+        """
+        Returns the formatted categories. The list is shared, so callers
+        must not change it.
+        """
+        return self.load()[0]
+
+    def json(self):
+        return self.load()[1]
+
+    def category(self, category_id):
+        """
+        Returns the formatted category with ``category_id``, with its
+        question_count, or None if there is no such category
+        """
+        for category in self.categories():
+            if category['id'] == category_id:
+                return category
+        return None
+
+    def count_question(self, question, action):
+        with self.lock:
+            if self.entry is None:
+                return
+            if action not in ('insert', 'delete'):
+                # The question may have moved to another category
+                self.entry = None
+                return
+            step = 1 if action == 'insert' else -1
+            # Copy the entries so lists already handed out stay unchanged
+            categories = [dict(category, question_count=
+                               category['question_count'] + step)
+                          if category['id'] == question.category
+                          else category for category in self.entry[0]]
+            self.entry = self._serialize(categories, self.entry[2])
+
+    def invalidate(self, obj=None, action=None):
+        with self.lock:
+            self.entry = None
+
+
+question_count = RowCount(Question)
+category_cache = CategoryCache()
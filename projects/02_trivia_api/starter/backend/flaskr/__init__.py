@@ -1,18 +1,70 @@
+import hmac
+import io
+import json
 import os
-from flask import Flask, request, abort, jsonify
+import click
+from flask import (Flask, Response, request, abort, jsonify,
+                   stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.sql.expression import func
 from flask_cors import CORS
 
-from models import setup_db, Question, Category
+from models import (setup_db, database_path, create_search_indexes,
+                    migrate_question_category, Question, Category)
+from cache import question_count, category_cache
+from quiz import quiz_deck, quiz_sessions, QUESTIONS_PER_QUIZ
+from search import find_questions, iter_questions
+from responses import response_cache
+from bulk import BATCH_SIZE, Importer, read_rows, export_questions
 
 QUESTIONS_PER_PAGE = 10
+MAX_PAGE_SIZE = 100
+MAX_QUESTIONS_PER_BUNDLE = 50
+STREAM_BATCH_SIZE = 500
+NDJSON = 'application/x-ndjson'
+
+
+def page_args():
+    """
+    Returns the page and page_size query parameters,
+    aborting with 400 if they are out of range
+    """
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', QUESTIONS_PER_PAGE, type=int)
+    if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+        abort(400)
+    return page, page_size
+
+
+def wants_stream():
+    """
+    True when the client asked for NDJSON, with ?stream=1 or
+    "Accept: application/x-ndjson"
+    """
+    if request.args.get('stream') == '1':
+        return True
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON]) == NDJSON
+
+
+def stream_ndjson(rows):
+    """
+    Returns a response writing each row's format() as a line of JSON
+    while the rows are read, instead of building the whole list first
+    """
+    def generate():
+        for row in rows:
+            yield json.dumps(row.format()) + '\n'
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    # Bulk import and export need "Authorization: Bearer <token>"
+    app.config['BULK_API_TOKEN'] = os.environ.get('TRIVIA_BULK_TOKEN')
+    if test_config:
+        app.config.update(test_config)
+    setup_db(app, app.config.get('DATABASE_PATH', database_path))
 
     '''
     @TODO: Set up CORS. Allow '*' for origins.
@@ -24,8 +76,15 @@ def create_app(test_config=None):
     '''
     @TODO: Use the after_request decorator to set Access-Control-Allow
     '''
+    @app.before_request
+    def before_request():
+        # Streamed listings are never cached
+        if not wants_stream():
+            return response_cache.lookup()
+
     @app.after_request
     def after_request(response):
+        response = response_cache.store(response)
         response.headers.add('Access-Control-Allow-Headers',
                              'Content-Type, Authorization')
         response.headers.add('Access-Control-Allow-Methods',
@@ -39,9 +98,19 @@ def create_app(test_config=None):
     '''
     @app.route('/api/categories', methods=['GET'])
     def get_categories():
-        categories = Category.query.all()
-        category_list = [cat.format() for cat in categories]
-        return jsonify({'categories': category_list}), 200
+        """
+        Function gets the categories with their question_count.
+        Results are paginated when page or page_size is given
+        """
+        if 'page' not in request.args and 'page_size' not in request.args:
+            return Response(category_cache.json(), status=200,
+                            mimetype='application/json')
+        page, page_size = page_args()
+        categories = category_cache.categories()
+        start = (page - 1) * page_size
+        return jsonify({'categories': categories[start:start + page_size],
+                        'page': page, 'page_size': page_size,
+                        'total_categories': len(categories)}), 200
 
     '''
     @TODO:
@@ -62,18 +131,15 @@ def create_app(test_config=None):
         Function gets all questions in the game.
         Returned results are paginated
         """
-        page = request.args.get('page', 1, type=int)
-        questions = Question.query.all()
-        categories = Category.query.all()
-        categories_returned = [category.format() for category in categories]
-        question_list = [question.format() for question in questions]
-        start = (page - 1) * 10
-        end = start + 10
+        page, page_size = page_args()
+        questions = Question.query.order_by(Question.id)\
+            .limit(page_size).offset((page - 1) * page_size).all()
         return jsonify({
-            'questions': question_list[start:end],
+            'questions': [question.format() for question in questions],
             'page': page,
-            'total_questions': len(question_list),
-            'categories': categories_returned,
+            'page_size': page_size,
+            'total_questions': question_count.get(),
+            'categories': category_cache.categories(),
             'current_category': ""
           }), 200
 
@@ -122,6 +188,13 @@ def create_app(test_config=None):
                 return jsonify({'success': False, 'error': 400,
                                 'message': f'{key} field is missing a value'
                                 }), 400
+        try:
+            category = int(category)
+        except (TypeError, ValueError):
+            category = None
+        if category_cache.category(category) is None:
+            return jsonify({'success': False, 'error': 400,
+                            'message': 'category does not exist'}), 400
         new_question = Question(question, answer, category, difficulty)
         new_question.insert()
         return jsonify({'success': True, 'message': 'Question was created',
@@ -140,14 +213,20 @@ def create_app(test_config=None):
     def search_questions():
         """
         Function performs a search against the Question model.
-        If a match is found it is then returned as json data
+        Matches are ranked and paginated; answers=true also searches
+        the answer text, stream=1 streams every match as NDJSON
         """
         search = request.args.get('search', '', type=str)
-        questions = Question.query.order_by(Question.id)\
-            .filter(Question.question.ilike('%{}%'.format(search)))\
-            .all()
+        include_answers = request.args.get('answers', '').lower() == 'true'
+        if wants_stream():
+            return stream_ndjson(iter_questions(search, include_answers,
+                                                STREAM_BATCH_SIZE))
+        page, page_size = page_args()
+        questions, total = find_questions(search, page, page_size,
+                                          include_answers)
         results = [question.format() for question in questions]
-        return jsonify({'success': True, 'questions': results}), 200
+        return jsonify({'success': True, 'questions': results,
+                        'total_questions': total, 'page': page}), 200
 
     '''
     @TODO:
@@ -157,15 +236,30 @@ def create_app(test_config=None):
     categories in the left column will cause only questions of that
     category to be shown.
     '''
-    @app.route('/api/categories/<category_id>/questions', methods=['GET'])
+    @app.route('/api/categories/<int:category_id>/questions',
+               methods=['GET'])
     def questions_per_category(category_id):
         """
-        Function gets questions per category
+        Function gets questions per category.
+        Returned results are paginated
         """
-        questions = Question.query.filter(Question.category == category_id
-                                          ).all()
-        results = [question.format() for question in questions]
-        return jsonify({'success': True, 'questions': results}), 200
+        category = category_cache.category(category_id)
+        if category is None:
+            abort(404)
+        query = Question.query.filter(Question.category == category_id)\
+            .order_by(Question.id)
+        if wants_stream():
+            return stream_ndjson(query.yield_per(STREAM_BATCH_SIZE))
+        page, page_size = page_args()
+        questions = query.limit(page_size).offset((page - 1) * page_size)
+        return jsonify({
+            'success': True,
+            'questions': [question.format() for question in questions],
+            'page': page,
+            'page_size': page_size,
+            'total_questions': category['question_count'],
+            'current_category': category['type']
+        }), 200
 
     '''
     @TODO:
@@ -182,30 +276,183 @@ def create_app(test_config=None):
     def get_questions_toplay():
         """
         Functions gets the next question to play
-        args: previous_question, category
+        args: previous_questions (ids of questions already asked), category
         """
         data = request.get_json()
         category = data.get('category', 'None')
-        previous_questions = data.get('previous_questions', None)
-        questions = Question.query.filter(Question.category == category).all()
-        all_questions = Question.query.all()
-        choice = ''
-        if category == 'click':
-            # Generate random question when user clicks all option
-            choice = Question.query\
-                        .filter(~Question.question.in_(previous_questions))\
-                        .order_by(func.random()).first()
-        else:
-            # Generate random question based on given category
-            choice = Question.query.filter(Question.category == category)\
-                        .filter(~Question.question.in_(previous_questions))\
-                        .order_by(func.random()).first()
+        try:
+            previous_ids = [int(question_id) for question_id in
+                            data.get('previous_questions') or []]
+        except (TypeError, ValueError):
+            abort(400)
+        choice = quiz_deck.next_question(category, previous_ids)
         if choice:
             choice = choice.format()
         else:
             choice = ""
         return jsonify({'success': True, 'question': choice}), 200
 
+    @app.route('/api/questions/play/batch', methods=['POST'])
+    def get_questions_bundle():
+        """
+        Functions gets the questions of a whole quiz round at once
+        args: previous_questions (ids of questions already asked), category,
+        questions (number of questions, default 5)
+        """
+        data = request.get_json() or {}
+        count = data.get('questions', QUESTIONS_PER_QUIZ)
+        if not isinstance(count, int) or \
+                not 1 <= count <= MAX_QUESTIONS_PER_BUNDLE:
+            abort(400)
+        try:
+            previous_ids = [int(question_id) for question_id in
+                            data.get('previous_questions') or []]
+        except (TypeError, ValueError):
+            abort(400)
+        questions = quiz_deck.next_questions(data.get('category', 'click'),
+                                             previous_ids, count)
+        return jsonify({
+            'success': True,
+            'questions': [question.format() for question in questions]
+        }), 200
+
+    def require_bulk_token():
+        token = app.config.get('BULK_API_TOKEN')
+        if not token:
+            abort(403)
+        header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(header.encode(),
+                                   'Bearer {}'.format(token).encode()):
+            abort(401)
+
+    @app.route('/api/questions/bulk', methods=['POST'])
+    def bulk_import_questions():
+        """
+        Function adds a batch of questions sent as NDJSON
+        (application/x-ndjson) or CSV (text/csv) with a header row.
+        Rows are validated one by one and questions whose text already
+        exists are skipped.
+        """
+        require_bulk_token()
+        file_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8',
+                                 newline='')
+        importer = Importer().run(read_rows(lines, file_format))
+        summary = importer.summary()
+        summary['success'] = True
+        return jsonify(summary), 200
+
+    @app.route('/api/questions/export', methods=['GET'])
+    def bulk_export_questions():
+        """
+        Function streams every question as NDJSON
+        """
+        require_bulk_token()
+        return Response(export_questions(), status=200,
+                        mimetype='application/x-ndjson')
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'file_format',
+                  type=click.Choice(['csv', 'ndjson']),
+                  help='File format, guessed from the extension by default.')
+    @click.option('--batch-size', default=BATCH_SIZE, show_default=True,
+                  help='Questions inserted per transaction.')
+    def import_questions_command(path, file_format, batch_size):
+        """Import questions from a CSV or NDJSON file."""
+        if file_format is None:
+            file_format = 'csv' if path.endswith('.csv') else 'ndjson'
+        with open(path, newline='', encoding='utf-8') as source:
+            importer = Importer(batch_size=batch_size)\
+                .run(read_rows(source, file_format))
+        for error in importer.errors:
+            click.echo('line {line}: {message}'.format(**error), err=True)
+        click.echo('{} inserted, {} duplicates, {} rejected'.format(
+            importer.inserted, importer.duplicates, importer.rejected))
+
+    @app.cli.command('create-search-indexes')
+    def create_search_indexes_command():
+        """Create the full-text search indexes used by question search."""
+        create_search_indexes()
+        app.config['FULL_TEXT_SEARCH'] = True
+        click.echo('Search indexes created')
+
+    @app.cli.command('migrate-question-category')
+    def migrate_question_category_command():
+        """Convert questions.category to an integer foreign key."""
+        cleared = migrate_question_category()
+        category_cache.invalidate()
+        click.echo('questions.category migrated, {} invalid categories '
+                   'cleared'.format(cleared))
+
+    @app.cli.command('export-questions')
+    @click.argument('path', default='-',
+                    type=click.Path(dir_okay=False, allow_dash=True))
+    def export_questions_command(path):
+        """Export every question as NDJSON, to stdout by default."""
+        with click.open_file(path, 'w', encoding='utf-8') as target:
+            for line in export_questions():
+                target.write(line)
+
+    def format_quiz(session):
+        return {'quiz_id': session['id'],
+                'category': session['category'],
+                'questions_asked': session['asked'],
+                'questions_per_quiz': session['length'],
+                'score': session['score']}
+
+    @app.route('/api/quizzes', methods=['POST'])
+    def start_quiz():
+        """
+        Function starts a quiz played on the server
+        and returns its id with the first question
+        args: category, questions (number of questions, default 5,
+        at most MAX_QUESTIONS_PER_BUNDLE)
+        """
+        data = request.get_json() or {}
+        length = data.get('questions', QUESTIONS_PER_QUIZ)
+        if not isinstance(length, int) or length < 1:
+            abort(400)
+        if length > MAX_QUESTIONS_PER_BUNDLE:
+            abort(422)
+        session, question = quiz_sessions.start(data.get('category', 'click'),
+                                                length)
+        quiz = format_quiz(session)
+        quiz.update(success=True,
+                    question=question.format() if question else "")
+        return jsonify(quiz), 201
+
+    @app.route('/api/quizzes/<quiz_id>', methods=['GET'])
+    def get_quiz(quiz_id):
+        """
+        Function gets the progress and score of a quiz
+        """
+        session = quiz_sessions.get(quiz_id)
+        if session is None:
+            abort(404)
+        quiz = format_quiz(session)
+        quiz.update(success=True, finished=session['current'] is None)
+        return jsonify(quiz), 200
+
+    @app.route('/api/quizzes/<quiz_id>/answers', methods=['POST'])
+    def answer_quiz(quiz_id):
+        """
+        Function grades the answer to the current question of a quiz
+        and returns the next question, or "" once the quiz is over
+        args: answer
+        """
+        data = request.get_json() or {}
+        result = quiz_sessions.answer(quiz_id, data.get('answer', ''))
+        if result is None:
+            abort(404)
+        session, answered, correct, question = result
+        if answered is None:
+            abort(422)
+        quiz = format_quiz(session)
+        quiz.update(success=True, correct=correct, answer=answered.answer,
+                    question=question.format() if question else "")
+        return jsonify(quiz), 200
+
     '''
     @TODO:
     Create error handlers for all expected errors
@@ -233,6 +480,28 @@ def create_app(test_config=None):
           'error': 400
         }), 400
 
+    @app.errorhandler(401)
+    def unauthorized_401(error):
+        """
+        Error handler for all 401 unauthorized errors
+        """
+        return jsonify({
+          'success': False,
+          'message': 'Unauthorized',
+          'error': 401
+        }), 401
+
+    @app.errorhandler(403)
+    def forbidden_403(error):
+        """
+        Error handler for all 403 forbidden errors
+        """
+        return jsonify({
+          'success': False,
+          'message': 'Forbidden',
+          'error': 403
+        }), 403
+
     @app.errorhandler(422)
     def un_processable_422(error):
         """
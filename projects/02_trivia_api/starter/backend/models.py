@@ -1,12 +1,15 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import threading
+from sqlalchemy import (Column, String, Integer, ForeignKey, create_engine,
+                        bindparam, event, text)
 from flask_sqlalchemy import SQLAlchemy
 import json
 
 database_name = "trivia"
-database_path = "postgres://{}:{}@{}/{}".format('postgres', 'psql',
-                                                'localhost:5432',
-                                                database_name)
+database_path = os.environ.get(
+    'DATABASE_URL', "postgres://{}:{}@{}/{}".format('postgres', 'psql',
+                                                    'localhost:5432',
+                                                    database_name))
 
 db = SQLAlchemy()
 
@@ -14,13 +17,204 @@ db = SQLAlchemy()
 def setup_db(app, database_path=database_path):
     '''
     setup_db(app)
-      binds a flask application and a SQLAlchemy service
+      binds a flask application and a SQLAlchemy service.
+      database_path may also be "sqlite://" for an in-memory database,
+      shared by every session of the process, or "sqlite:///<file>"
     '''
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+    if db.engine.dialect.name == 'sqlite':
+        enable_sqlite_transactions(db.engine)
     db.create_all()
+    app.config['FULL_TEXT_SEARCH'] = search_indexes_exist()
+
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    # Stop pysqlite from issuing BEGIN itself, which breaks SAVEPOINT
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin(connection):
+    connection.execute(text("BEGIN"))
+
+
+def enable_sqlite_transactions(engine):
+    '''
+    enable_sqlite_transactions(engine)
+      lets SQLAlchemy begin SQLite transactions, so that nested
+      transactions (SAVEPOINT) work as on Postgres
+    '''
+    if not event.contains(engine, 'connect', _sqlite_connect):
+        event.listen(engine, 'connect', _sqlite_connect)
+        event.listen(engine, 'begin', _sqlite_begin)
+
+
+# questions.category used to be a string column without an index; it is
+# now an integer foreign key to categories.id, indexed for the category
+# listing. Tables made by create_all already have both; older databases
+# are converted once with "flask migrate-question-category".
+POSTGRES_CATEGORY_TYPE = (
+    "SELECT data_type FROM information_schema.columns "
+    "WHERE table_name = 'questions' AND column_name = 'category'")
+POSTGRES_CATEGORY_FK = (
+    "SELECT 1 FROM information_schema.key_column_usage k "
+    "JOIN information_schema.table_constraints c "
+    "ON c.constraint_name = k.constraint_name "
+    "WHERE c.constraint_type = 'FOREIGN KEY' "
+    "AND k.table_name = 'questions' AND k.column_name = 'category'")
+POSTGRES_CATEGORY_NON_NUMERIC = (
+    "UPDATE questions SET category = NULL "
+    "WHERE trim(category) !~ '^[0-9]{1,9}$'")
+POSTGRES_CATEGORY_COLUMN = (
+    "ALTER TABLE questions ALTER COLUMN category TYPE integer "
+    "USING trim(category)::integer")
+POSTGRES_CATEGORY_CONSTRAINT = (
+    "ALTER TABLE questions ADD CONSTRAINT questions_category_fkey "
+    "FOREIGN KEY (category) REFERENCES categories (id) "
+    "ON UPDATE CASCADE ON DELETE SET NULL")
+# SQLite casts text that is not a number to 0, which is no category id
+CATEGORY_ORPHANS = (
+    "UPDATE questions SET category = NULL WHERE category IS NOT NULL "
+    "AND CAST(category AS INTEGER) NOT IN (SELECT id FROM categories)")
+CATEGORY_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_questions_category "
+    "ON questions (category)")
+
+
+def migrate_question_category():
+    '''
+    migrate_question_category()
+      converts questions.category to an indexed integer foreign key
+      on databases created before it was one. Categories that are not
+      numbers or not the id of a category are cleared first, so the
+      conversion cannot fail on them. Returns the number of questions
+      whose category was cleared.
+    '''
+    dialect = db.engine.dialect.name
+    cleared = 0
+    connection = db.session.connection()
+    if dialect == 'postgresql':
+        data_type = connection.execute(text(POSTGRES_CATEGORY_TYPE)).scalar()
+        if data_type != 'integer':
+            cleared += connection.execute(
+                text(POSTGRES_CATEGORY_NON_NUMERIC)).rowcount
+            connection.execute(text(POSTGRES_CATEGORY_COLUMN))
+    cleared += connection.execute(text(CATEGORY_ORPHANS)).rowcount
+    if dialect == 'postgresql' and \
+            not connection.execute(text(POSTGRES_CATEGORY_FK)).first():
+        connection.execute(text(POSTGRES_CATEGORY_CONSTRAINT))
+    # SQLite cannot change a column type in place; text values still
+    # compare equal to integers there, so the index is enough
+    connection.execute(text(CATEGORY_INDEX))
+    db.session.commit()
+    return cleared
+
+
+# Full-text search indexes on question and answer text, see search.py.
+# Postgres gets tsvector indexes for word matches and pg_trgm indexes so
+# substring matches are indexed too. SQLite gets an FTS5 table kept in
+# sync with triggers. They are made once by "flask create-search-indexes",
+# since CREATE EXTENSION needs privileges the app should not run with.
+POSTGRES_SEARCH_INDEXES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_questions_question_tsv ON questions "
+    "USING gin (to_tsvector('english', coalesce(question, '')))",
+    "CREATE INDEX IF NOT EXISTS ix_questions_answer_tsv ON questions "
+    "USING gin (to_tsvector('english', coalesce(answer, '')))",
+    "CREATE INDEX IF NOT EXISTS ix_questions_question_trgm ON questions "
+    "USING gin (question gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_questions_answer_trgm ON questions "
+    "USING gin (answer gin_trgm_ops)"
+]
+
+SQLITE_SEARCH_INDEXES = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+    "question, answer, content='questions', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON "
+    "questions BEGIN INSERT INTO questions_fts(rowid, question, answer) "
+    "VALUES (new.id, new.question, new.answer); END",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON "
+    "questions BEGIN INSERT INTO questions_fts(questions_fts, rowid, "
+    "question, answer) VALUES ('delete', old.id, old.question, old.answer); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE ON "
+    "questions BEGIN INSERT INTO questions_fts(questions_fts, rowid, "
+    "question, answer) VALUES ('delete', old.id, old.question, old.answer); "
+    "INSERT INTO questions_fts(rowid, question, answer) "
+    "VALUES (new.id, new.question, new.answer); END"
+]
+
+POSTGRES_SEARCH_INDEX_NAMES = [
+    'ix_questions_question_tsv', 'ix_questions_answer_tsv',
+    'ix_questions_question_trgm', 'ix_questions_answer_trgm'
+]
+
+
+def search_indexes_exist():
+    '''
+    search_indexes_exist()
+      True when create_search_indexes has been run on this database
+    '''
+    dialect = db.engine.dialect.name
+    with db.engine.connect() as connection:
+        if dialect == 'postgresql':
+            found = connection.execute(text(
+                "SELECT count(*) FROM pg_indexes WHERE tablename = 'questions' "
+                "AND indexname IN :names"
+            ).bindparams(bindparam('names', expanding=True)),
+                {'names': POSTGRES_SEARCH_INDEX_NAMES}).scalar()
+            return found == len(POSTGRES_SEARCH_INDEX_NAMES)
+        if dialect == 'sqlite':
+            return connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'"
+            )).first() is not None
+    return False
+
+
+def create_search_indexes():
+    '''
+    create_search_indexes()
+      creates the full-text search indexes if they are missing
+    '''
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialect == 'postgresql':
+            for statement in POSTGRES_SEARCH_INDEXES:
+                connection.execute(text(statement))
+        elif dialect == 'sqlite':
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'"
+            )).first()
+            for statement in SQLITE_SEARCH_INDEXES:
+                connection.execute(text(statement))
+            if not exists:
+                # Index the questions stored before the table existed
+                connection.execute(text(
+                    "INSERT INTO questions_fts(questions_fts) "
+                    "VALUES ('rebuild')"))
+
+
+change_callbacks = {}
+
+
+class DataVersion(object):
+    """
+    Counter bumped after every committed write made through BaseModel,
+    used to tell whether cached responses are still current
+    """
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def bump(self):
+        with self.lock:
+            self.value += 1
+            return self.value
+
+
+data_version = DataVersion()
 
 
 class BaseModel(object):
@@ -30,13 +224,34 @@ class BaseModel(object):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        self.changed('insert')
 
     def update(self):
         db.session.commit()
+        self.changed('update')
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        self.changed('delete')
+
+    def changed(self, action):
+        """
+        Runs the callbacks registered for this model after a committed
+        insert, update or delete
+        """
+        data_version.bump()
+        for callback in change_callbacks.get(type(self), []):
+            callback(self, action)
+
+    @classmethod
+    def on_change(cls, callback):
+        """
+        Registers callback(obj, action) to run after every committed
+        write of this model made through insert, update or delete
+        """
+        change_callbacks.setdefault(cls, []).append(callback)
+        return callback
 
 
 class Question(db.Model, BaseModel):
@@ -48,7 +263,10 @@ class Question(db.Model, BaseModel):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id',
+                                          onupdate='CASCADE',
+                                          ondelete='SET NULL'),
+                      index=True)
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -0,0 +1,284 @@
+import collections
+import random
+import re
+import threading
+import time
+import uuid
+
+from models import db, Question
+
+ALL_CATEGORIES = 'click'
+QUESTIONS_PER_QUIZ = 5
+PUNCTUATION = re.compile(r'[.,/#!$%^&*;:{}=\-_`~()]')
+
+
+class Pool(object):
+    """
+    Shuffled list of question ids with O(1) add and remove
+    """
+    def __init__(self, rng):
+        self.rng = rng
+        self.ids = []
+        self.positions = {}
+
+    def add(self, question_id):
+        if question_id in self.positions:
+            return
+        # Swap the new id with a random one to keep the list shuffled
+        self.ids.append(question_id)
+        index = self.rng.randrange(len(self.ids))
+        self._swap(index, len(self.ids) - 1)
+
+    def remove(self, question_id):
+        index = self.positions.pop(question_id, None)
+        if index is None:
+            return
+        last = self.ids.pop()
+        if index < len(self.ids):
+            self.ids[index] = last
+            self.positions[last] = index
+
+    def _swap(self, first, second):
+        self.ids[first], self.ids[second] = self.ids[second], self.ids[first]
+        self.positions[self.ids[first]] = first
+        self.positions[self.ids[second]] = second
+
+    def pick(self, seen):
+        """
+        Returns an id drawn uniformly from those not in ``seen``, or None.
+        Random ids are drawn until one is unseen, which takes a couple of
+        draws unless most of the pool was seen; after len(seen) + 1 misses
+        the unseen ids are listed and one of them is chosen.
+        """
+        if not self.ids:
+            return None
+        for _ in range(len(seen) + 1):
+            question_id = self.rng.choice(self.ids)
+            if question_id not in seen:
+                return question_id
+        unseen = [question_id for question_id in self.ids if question_id not in seen]
+        return self.rng.choice(unseen) if unseen else None
+
+
+class QuizDeck(object):
+    """
+    Shuffled pools of question ids, one per category plus one for all
+    questions, used to deal quiz questions without sorting the table.
+    Pools are built on first use and follow writes made through
+    BaseModel; they are rebuilt once older than ``ttl`` seconds to pick
+    up writes made by other processes.
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.rng = random.Random()
+        self.pools = None
+        self.categories = {}
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+        Question.on_change(self.on_change)
+
+    def _load(self):
+        self.pools = {ALL_CATEGORIES: Pool(self.rng)}
+        self.categories = {}
+        rows = db.session.query(Question.id, Question.category).all()
+        self.rng.shuffle(rows)
+        for question_id, category in rows:
+            self._add(question_id, category)
+        self.loaded_at = time.time()
+
+    def _add(self, question_id, category):
+        category = str(category)
+        self.categories[question_id] = category
+        self.pools[ALL_CATEGORIES].add(question_id)
+        self.pools.setdefault(category, Pool(self.rng)).add(question_id)
+
+    def _remove(self, question_id):
+        category = self.categories.pop(question_id, None)
+        self.pools[ALL_CATEGORIES].remove(question_id)
+        if category in self.pools:
+            self.pools[category].remove(question_id)
+
+    def reset(self):
+        """
+        Drops the pools so they are rebuilt on next use
+        """
+        with self.lock:
+            self.pools = None
+
+    def on_change(self, question, action):
+        with self.lock:
+            if self.pools is None:
+                return
+            self._remove(question.id)
+            if action != 'delete':
+                self._add(question.id, question.category)
+
+    def next_question(self, category, previous_ids):
+        """
+        Returns a random question of ``category`` (or of any category
+        for 'click') whose id is not in ``previous_ids``, or None
+        """
+        seen = set(previous_ids)
+        while True:
+            with self.lock:
+                if self.pools is None or \
+                        time.time() - self.loaded_at > self.ttl:
+                    self._load()
+                pool = self.pools.get(str(category))
+                question_id = pool.pick(seen) if pool else None
+            if question_id is None:
+                return None
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+            # Deleted by another process since the pools were built
+            with self.lock:
+                self._remove(question_id)
+
+    def next_questions(self, category, previous_ids, count):
+        """
+        Returns up to ``count`` distinct random questions of ``category``
+        (or of any category for 'click') whose ids are not in
+        ``previous_ids``, read with a single primary key query
+        """
+        seen = set(previous_ids)
+        questions = []
+        while len(questions) < count:
+            with self.lock:
+                if self.pools is None or \
+                        time.time() - self.loaded_at > self.ttl:
+                    self._load()
+                pool = self.pools.get(str(category))
+                ids = []
+                while pool and len(questions) + len(ids) < count:
+                    question_id = pool.pick(seen)
+                    if question_id is None:
+                        break
+                    seen.add(question_id)
+                    ids.append(question_id)
+            if not ids:
+                break
+            by_id = dict((question.id, question) for question in
+                         Question.query.filter(Question.id.in_(ids)))
+            for question_id in ids:
+                if question_id in by_id:
+                    questions.append(by_id[question_id])
+                else:
+                    # Deleted by another process since the pools were built
+                    with self.lock:
+                        self._remove(question_id)
+        return questions
+
+
+def is_correct(answer, guess):
+    """
+    Same rule as the quiz view: the guess, without punctuation, must be
+    one of the words of the answer
+    """
+    guess = PUNCTUATION.sub('', guess or '').lower()
+    return guess in (answer or '').lower().split(' ')
+
+
+class MemoryStore(object):
+    """
+    In-process store for quiz sessions, evicting the least recently used
+    session when full and sessions idle for more than ``ttl`` seconds.
+    A shared store (e.g. Redis) can replace it by providing the same
+    get, set and delete methods; sessions are plain dicts.
+    """
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, touched = entry
+            if time.time() - touched > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class QuizSessions(object):
+    """
+    Quizzes played on the server: each session keeps its category, the
+    ids of the questions already asked, the score and the question
+    drawn for the next answer, so play requests stay the same size
+    however long the quiz is. Answers to the same session are graded one
+    at a time within the process, so a repeated request cannot score or
+    advance the quiz twice.
+    """
+    def __init__(self, deck, store=None, lock_stripes=64):
+        self.deck = deck
+        self.store = store or MemoryStore()
+        self.locks = [threading.Lock() for _ in range(lock_stripes)]
+
+    def _lock(self, quiz_id):
+        return self.locks[hash(quiz_id) % len(self.locks)]
+
+    def _draw(self, session):
+        if session['asked'] >= session['length']:
+            return None
+        return self.deck.next_question(session['category'], session['seen'])
+
+    def start(self, category, length=QUESTIONS_PER_QUIZ):
+        """
+        Creates a session and returns it with its first question
+        """
+        session = {'id': uuid.uuid4().hex, 'category': str(category),
+                   'seen': [], 'asked': 0, 'score': 0, 'length': length,
+                   'current': None}
+        question = self._draw(session)
+        session['current'] = question.id if question else None
+        self.store.set(session['id'], session)
+        return session, question
+
+    def get(self, quiz_id):
+        return self.store.get(quiz_id)
+
+    def answer(self, quiz_id, guess):
+        """
+        Grades ``guess`` against the current question and draws the next
+        one. Returns (session, answered question, correct, next question);
+        the answered question is None when the quiz is over.
+        """
+        with self._lock(quiz_id):
+            session = self.store.get(quiz_id)
+            if session is None:
+                return None
+            answered = Question.query.get(session['current']) \
+                if session['current'] is not None else None
+            if answered is None:
+                session['current'] = None
+                self.store.set(quiz_id, session)
+                return session, None, False, None
+            correct = is_correct(answered.answer, guess)
+            session['seen'].append(answered.id)
+            session['asked'] += 1
+            session['score'] += int(correct)
+            question = self._draw(session)
+            session['current'] = question.id if question else None
+            self.store.set(quiz_id, session)
+            return session, answered, correct, question
+
+
+quiz_deck = QuizDeck()
+quiz_sessions = QuizSessions(quiz_deck)
@@ -0,0 +1,120 @@
+import collections
+import gzip
+import threading
+import time
+import uuid
+from flask import Response, g, request
+
+from models import data_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_SIZE = 500
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    if encoding == 'gzip':
+        return gzip.compress(body)
+    return body
+
+
+class ResponseCache(object):
+    """
+    Conditional and precompressed responses for read endpoints.
+    Responses get a strong ETag made from the data version, which writes
+    through BaseModel bump, so a matching If-None-Match is answered with
+    304 before the view runs. The encoded bodies of the most recently
+    used URLs are kept and served again while the data version has not
+    changed. ETags also change every ``ttl`` seconds, since writes made
+    by other processes do not bump this process's version.
+    """
+    def __init__(self, endpoints, max_entries=256, ttl=60):
+        self.endpoints = set(endpoints)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Tells apart the ETags of processes that restarted
+        self.token = uuid.uuid4().hex[:8]
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def cacheable(self):
+        return request.method == 'GET' and request.endpoint in self.endpoints
+
+    def etag(self, encoding):
+        return '{}-{}-{}-{}'.format(self.token, data_version.value,
+                                      int(time.time() // self.ttl), encoding)
+
+    def encoding(self):
+        """
+        Returns the best encoding the client accepts
+        """
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return 'identity'
+
+    def _headers(self, response, etag, encoding):
+        response.set_etag(etag)
+        response.vary.add('Accept')
+        response.vary.add('Accept-Encoding')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def lookup(self):
+        """
+        Returns a 304 or a cached response for the current request, or
+        None if the view has to run
+        """
+        if not self.cacheable():
+            return None
+        encoding = self.encoding()
+        etags = set([self.etag(encoding), self.etag('identity')])
+        g.response_etags = etags
+        if any(request.if_none_match.contains(etag) for etag in etags):
+            response = Response(status=304)
+            response.set_etag(self.etag(encoding))
+            return response
+        with self.lock:
+            entry = self.entries.get((request.full_path, encoding))
+            if entry is None or entry[0] not in etags:
+                return None
+            self.entries.move_to_end((request.full_path, encoding))
+        etag, used, body, mimetype = entry
+        return self._headers(Response(body, mimetype=mimetype), etag, used)
+
+    def store(self, response):
+        """
+        Adds the ETag to a response of a cacheable view, compresses it
+        and keeps the encoded body
+        """
+        if getattr(g, 'response_etags', None) is None or \
+                response.status_code != 200 or response.is_streamed or \
+                'ETag' in response.headers:
+            return response
+        encoding = self.encoding()
+        body = response.get_data()
+        used = encoding if len(body) >= MIN_COMPRESS_SIZE else 'identity'
+        etag = self.etag(used)
+        if etag not in g.response_etags:
+            # Written while the view ran; the ETag would not match the body
+            return response
+        body = compress(body, used)
+        response.set_data(body)
+        with self.lock:
+            key = (request.full_path, encoding)
+            self.entries[key] = (etag, used, body, response.mimetype)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return self._headers(response, etag, used)
+
+
+response_cache = ResponseCache(['get_categories', 'get_questions',
+                                'questions_per_category'])
@@ -0,0 +1,119 @@
+import re
+from flask import current_app
+from sqlalchemy import or_, text
+from sqlalchemy.sql.expression import func
+
+from models import db, Question
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _by_ids(ids):
+    """
+    Returns the questions with ``ids``, in the order of ``ids``
+    """
+    if not ids:
+        return []
+    questions = Question.query.filter(Question.id.in_(ids)).all()
+    by_id = dict((question.id, question) for question in questions)
+    return [by_id[question_id] for question_id in ids if question_id in by_id]
+
+
+def _search_postgres(term, offset, limit, include_answers):
+    query = func.plainto_tsquery('english', term)
+    pattern = '%{}%'.format(escape_like(term))
+    columns = [Question.question]
+    if include_answers:
+        columns.append(Question.answer)
+    matches, ranks = [], []
+    for column in columns:
+        vector = func.to_tsvector('english', func.coalesce(column, ''))
+        # Word matches use the tsvector index, substrings the pg_trgm one
+        matches.append(vector.op('@@')(query))
+        matches.append(column.ilike(pattern, escape='\\'))
+        ranks.append(func.ts_rank(vector, query) +
+                     func.similarity(func.coalesce(column, ''), term))
+    condition = or_(*matches)
+    rank = sum(ranks[1:], ranks[0])
+    total = db.session.query(func.count(Question.id)).filter(condition)\
+        .scalar()
+    questions = Question.query.filter(condition)\
+        .order_by(rank.desc(), Question.id)\
+        .offset(offset).limit(limit).all()
+    return questions, total
+
+
+def _search_sqlite(term, offset, limit, include_answers):
+    words = WORD.findall(term)
+    if not words:
+        return [], 0
+    # Every word must match, as a prefix, in the question (or answer)
+    phrases = ['"{}"*'.format(word) for word in words]
+    if include_answers:
+        match = ' AND '.join(phrases)
+    else:
+        match = ' AND '.join('question : ' + phrase for phrase in phrases)
+    params = {'match': match, 'limit': limit, 'offset': offset}
+    total = db.session.execute(text(
+        "SELECT count(*) FROM questions_fts WHERE questions_fts MATCH :match"
+    ), params).scalar()
+    rows = db.session.execute(text(
+        "SELECT rowid FROM questions_fts WHERE questions_fts MATCH :match "
+        "ORDER BY bm25(questions_fts), rowid LIMIT :limit OFFSET :offset"
+    ), params)
+    return _by_ids([row[0] for row in rows]), total
+
+
+def _search_like(term, offset, limit, include_answers):
+    pattern = '%{}%'.format(escape_like(term))
+    condition = Question.question.ilike(pattern, escape='\\')
+    if include_answers:
+        condition = or_(condition, Question.answer.ilike(pattern, escape='\\'))
+    total = db.session.query(func.count(Question.id)).filter(condition)\
+        .scalar()
+    questions = Question.query.filter(condition).order_by(Question.id)\
+        .offset(offset).limit(limit).all()
+    return questions, total
+
+
+BACKENDS = {
+    'postgresql': _search_postgres,
+    'sqlite': _search_sqlite
+}
+
+
+def find_questions(term, page=1, page_size=10, include_answers=False):
+    """
+    Returns a page of the questions matching ``term``, best matches
+    first, and the number of matches. Uses the full-text indexes made by
+    create_search_indexes, or a LIKE scan until they exist and on other
+    databases.
+    """
+    term = term.strip()
+    if not term:
+        return [], 0
+    backend = _search_like
+    if current_app.config.get('FULL_TEXT_SEARCH'):
+        backend = BACKENDS.get(db.engine.dialect.name, _search_like)
+    return backend(term, (page - 1) * page_size, page_size, include_answers)
+
+
+def iter_questions(term, include_answers=False, batch_size=500):
+    """
+    Yields every question matching ``term``, best matches first,
+    reading the matches one page of ``batch_size`` at a time
+    """
+    page = 1
+    while True:
+        questions, total = find_questions(term, page, batch_size,
+                                          include_answers)
+        for question in questions:
+            yield question
+        if page * batch_size >= total or not questions:
+            return
+        page += 1
+        db.session.expunge_all()
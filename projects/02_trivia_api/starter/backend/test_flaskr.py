@@ -1,40 +1,75 @@
+import gzip
 import os
+import random
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
-from flask import current_app as app
+from sqlalchemy import event
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import db, data_version, Question, Category
+from cache import question_count, category_cache
+from quiz import Pool, quiz_deck
+
+
+def worker_database_path():
+    """
+    In-memory SQLite unless TRIVIA_TEST_DATABASE is set. "{worker}" in
+    it is replaced by the pytest-xdist worker id, so that tests run in
+    parallel processes get a database each.
+    """
+    path = os.environ.get('TRIVIA_TEST_DATABASE', 'sqlite://')
+    return path.format(worker=os.environ.get('PYTEST_XDIST_WORKER', 'main'))
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
+    @classmethod
+    def setUpClass(cls):
+        """Create the app and the database once for all tests"""
+        cls.app = create_app({'DATABASE_PATH': worker_database_path()})
+        cls.app.test_cli_runner().invoke(args=['create-search-indexes'])
+
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
+        """Define test variables and start the test transaction."""
+        self.app.config['BULK_API_TOKEN'] = None
         self.app_context = self.app.app_context()
         self.app_context.push()
         self.client = self.app.test_client()
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}:{}@{}/{}"\
-                             .format('postgres', 'psql',
-                                     'localhost:5432',
-                                     self.database_name)
-        setup_db(self.app, self.database_path)
+        # Each test runs in a transaction that tearDown rolls back;
+        # commits made by the app only release a SAVEPOINT
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        db.session.remove()
+        self.session_options = dict(db.session.session_factory.kw)
+        db.session.configure(bind=self.connection, binds={})
+        self.savepoint = self.connection.begin_nested()
+        event.listen(db.session, 'after_transaction_end',
+                     self.restart_savepoint)
 
         category = Category(type="sports")
         category.insert()
 
+    def restart_savepoint(self, session, transaction):
+        if not self.savepoint.is_active:
+            self.savepoint = self.connection.begin_nested()
+
     def tearDown(self):
         """Executed after reach test"""
-        questions = Question.query.all()
-        categories = Category.query.all()
-        for qtn in questions:
-            qtn.delete()
-        for category in categories:
-            category.delete()
+        event.remove(db.session, 'after_transaction_end',
+                     self.restart_savepoint)
+        db.session.remove()
+        db.session.session_factory.kw = self.session_options
+        if self.savepoint.is_active:
+            self.savepoint.rollback()
+        self.transaction.rollback()
+        self.connection.close()
+        # The rollback skips the BaseModel callbacks that keep these current
+        data_version.bump()
+        question_count.clear()
+        category_cache.invalidate()
+        quiz_deck.reset()
+        self.app_context.pop()
 
     """
     TODO
@@ -91,6 +126,101 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res_data['questions'][0]['question'],
                          "what is soccer?")
 
+    def test_api_paginates_questions_with_page_size(self):
+        for number in range(3):
+            Question("question {}".format(number), "answer", 1, 1).insert()
+        res = self.client.get('/api/questions?page=2&page_size=2')
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res_data['page_size'], 2)
+        self.assertEqual(res_data['total_questions'], 3)
+        self.assertEqual([qtn['question'] for qtn in res_data['questions']],
+                         ["question 2"])
+
+    def test_api_total_questions_follows_inserts_and_deletes(self):
+        question = Question("what is music?", "Its good sounds", 1, 1)
+        question.insert()
+        res = self.client.get('/api/questions')
+        total = json.loads(res.data)['total_questions']
+        question.delete()
+        res = self.client.get('/api/questions')
+        self.assertEqual(json.loads(res.data)['total_questions'], total - 1)
+
+    def test_api_returns_error_for_invalid_page_size(self):
+        res = self.client.get('/api/questions?page_size=0')
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(res_data['success'])
+
+    def test_api_gets_categories(self):
+        res = self.client.get('/api/categories')
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content_type, 'application/json')
+        self.assertEqual([cat['type'] for cat in res_data['categories']],
+                         ["sports"])
+
+    def test_api_categories_follow_inserts_and_deletes(self):
+        self.client.get('/api/categories')
+        category = Category(type="science")
+        category.insert()
+        res = self.client.get('/api/categories')
+        types = [cat['type'] for cat in json.loads(res.data)['categories']]
+        self.assertIn("science", types)
+        category.delete()
+        res = self.client.get('/api/questions')
+        types = [cat['type'] for cat in json.loads(res.data)['categories']]
+        self.assertNotIn("science", types)
+
+    def test_api_categories_count_questions(self):
+        category = Category.query.first()
+        res = self.client.get('/api/categories')
+        self.assertEqual(json.loads(res.data)['categories'][0]
+                         ['question_count'], 0)
+        question = Question("what is soccer?", "football", category.id, 1)
+        question.insert()
+        res = self.client.get('/api/categories')
+        self.assertEqual(json.loads(res.data)['categories'][0]
+                         ['question_count'], 1)
+        question.delete()
+        res = self.client.get('/api/categories')
+        self.assertEqual(json.loads(res.data)['categories'][0]
+                         ['question_count'], 0)
+
+    def test_api_paginates_categories(self):
+        Category(type="science").insert()
+        res = self.client.get('/api/categories?page=2&page_size=1')
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res_data['total_categories'], 2)
+        self.assertEqual([cat['type'] for cat in res_data['categories']],
+                         ["science"])
+
+    def test_api_answers_304_until_data_changes(self):
+        res = self.client.get('/api/categories')
+        etag = res.headers['ETag']
+        res = self.client.get('/api/categories',
+                              headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        Category(type="science").insert()
+        res = self.client.get('/api/categories',
+                              headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_api_serves_compressed_questions(self):
+        category = Category.query.first()
+        for number in range(10):
+            Question("question {}".format(number), "answer",
+                     category.id, 1).insert()
+        plain = self.client.get('/api/questions')
+        for attempt in range(2):
+            res = self.client.get('/api/questions',
+                                  headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(json.loads(gzip.decompress(res.data)),
+                             json.loads(plain.data))
+
     def test_api_deletes_questions(self):
         question = Question("what is music?", "Its good sounds", 1, 1)
         question.insert()
@@ -118,6 +248,42 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res_data['questions'][0]['question'],
                          "what is soccer?")
 
+    def test_api_search_ranks_and_paginates_questions(self):
+        Question("what is soccer?", "it is football", 1, 1).insert()
+        Question("who plays soccer in soccer stadiums?", "players",
+                 1, 1).insert()
+        Question("what is tennis?", "a soccer alternative", 1, 1).insert()
+        res = self.client.post(
+            '/api/search/questions?search=soccer&page_size=1')
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res_data['total_questions'], 2)
+        self.assertEqual(len(res_data['questions']), 1)
+        res = self.client.post(
+            '/api/search/questions?search=soccer&answers=true')
+        res_data = json.loads(res.data)
+        self.assertEqual(res_data['total_questions'], 3)
+
+    def test_api_search_follows_question_updates(self):
+        question = Question("what is soccer?", "it is football", 1, 1)
+        question.insert()
+        question.question = "what is rugby?"
+        question.update()
+        res = self.client.post('/api/search/questions?search=soccer')
+        self.assertEqual(json.loads(res.data)['questions'], [])
+        res = self.client.post('/api/search/questions?search=rugby')
+        self.assertEqual(json.loads(res.data)['questions'][0]['id'],
+                         question.id)
+
+    def test_api_search_falls_back_without_indexes(self):
+        Question("what is soccer?", "it is football", 1, 1).insert()
+        self.app.config['FULL_TEXT_SEARCH'] = False
+        self.addCleanup(self.app.config.__setitem__, 'FULL_TEXT_SEARCH', True)
+        res = self.client.post('/api/search/questions?search=socc')
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res_data['total_questions'], 1)
+
     def test_api_gets_questions_by_category(self):
         category = Category(type="sports")
         category.insert()
@@ -139,6 +305,52 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res_data['questions'][0]['question'],
                          "what is soccer?")
 
+    def test_api_paginates_questions_by_category(self):
+        category = Category.query.first()
+        for number in range(3):
+            Question("question {}".format(number), "answer",
+                     category.id, 1).insert()
+        res = self.client.get('/api/categories/{}/questions?page=2'
+                              '&page_size=2'.format(category.id))
+        res_data = json.loads(res.data)
+        self.assertEqual(res_data['total_questions'], 3)
+        self.assertEqual(res_data['current_category'], "sports")
+        self.assertEqual([q['question'] for q in res_data['questions']],
+                         ["question 2"])
+
+    def test_api_returns_404_for_questions_of_unknown_category(self):
+        res = self.client.get('/api/categories/1000/questions')
+        self.assertEqual(res.status_code, 404)
+
+    def test_api_rejects_question_of_unknown_category(self):
+        res = self.client.post('/api/questions', json={
+            "question": "what is soccer?", "answer": "football",
+            "category": 1000, "difficulty": 1})
+        self.assertEqual(res.status_code, 400)
+
+    def test_api_streams_questions_by_category(self):
+        category = Category(type="sports")
+        category.insert()
+        for text in ("what is soccer?", "what is rugby?"):
+            Question(text, "a sport", category.id, 1).insert()
+        res = self.client.get(
+            '/api/categories/{}/questions'.format(category.id),
+            headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in res.data.splitlines()]
+        self.assertEqual([line['question'] for line in lines],
+                         ["what is soccer?", "what is rugby?"])
+
+    def test_api_streams_search_results(self):
+        Question("what is soccer?", "it is football", 1, 1).insert()
+        Question("what is tennis?", "a racket sport", 1, 1).insert()
+        res = self.client.post('/api/search/questions?search=soccer&stream=1')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in res.data.splitlines()]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['question'], "what is soccer?")
+
     def test_api_gets_question_to_play(self):
         category = Category("entertainment")
         category.insert()
@@ -157,7 +369,7 @@ class TriviaTestCase(unittest.TestCase):
 
         play_data = {
             "category": str(category.id),
-            "previous_questions": [str(question3.question)]
+            "previous_questions": [question3.id]
         }
         data = json.dumps(play_data)
         res = self.client.post('/api/questions/play', data=data,
@@ -165,6 +377,192 @@ class TriviaTestCase(unittest.TestCase):
         res_data = json.loads(res.data)
         self.assertEqual(res.status_code, 200)
         self.assertTrue(res_data['success'])
+        self.assertIn(res_data['question']['id'],
+                      [question.id, question2.id, question4.id])
+
+    def test_api_play_skips_previous_and_deleted_questions(self):
+        category = Category("entertainment")
+        category.insert()
+        question = Question("what is music?", "Its good sounds",
+                            category.id, 1)
+        question.insert()
+        question2 = Question("what is a movie?", "It looks good",
+                             category.id, 1)
+        question2.insert()
+        play_data = json.dumps({"category": str(category.id),
+                                "previous_questions": []})
+        self.client.post('/api/questions/play', data=play_data,
+                         content_type="application/json")
+        question2.delete()
+        question3 = Question("what is a game?", "It looks real",
+                             category.id, 1)
+        question3.insert()
+        play_data = json.dumps({"category": "click",
+                                "previous_questions": [question.id]})
+        res = self.client.post('/api/questions/play', data=play_data,
+                               content_type="application/json")
+        self.assertEqual(json.loads(res.data)['question']['id'],
+                         question3.id)
+        play_data = json.dumps({"category": str(category.id),
+                                "previous_questions": [question.id,
+                                                       question3.id]})
+        res = self.client.post('/api/questions/play', data=play_data,
+                               content_type="application/json")
+        self.assertEqual(json.loads(res.data)['question'], "")
+
+    def test_api_gets_a_bundle_of_questions_to_play(self):
+        category = Category("entertainment")
+        category.insert()
+        questions = [Question("question {}".format(number), "answer",
+                              category.id, 1) for number in range(4)]
+        for question in questions:
+            question.insert()
+        res = self.client.post('/api/questions/play/batch', json={
+            "category": str(category.id),
+            "previous_questions": [questions[0].id],
+            "questions": 5})
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        ids = [question['id'] for question in res_data['questions']]
+        self.assertEqual(sorted(ids),
+                         [question.id for question in questions[1:]])
+        res = self.client.post('/api/questions/play/batch', json={
+            "category": "click", "questions": 2})
+        ids = [question['id'] for question in
+               json.loads(res.data)['questions']]
+        self.assertEqual(len(set(ids)), 2)
+
+    def test_migrate_question_category_clears_unknown_categories(self):
+        category = Category.query.first()
+        kept = Question("what is soccer?", "it is football", category.id, 1)
+        kept.insert()
+        orphan = Question("what is rugby?", "it is football", 999, 1)
+        orphan.insert()
+        result = self.app.test_cli_runner().invoke(
+            args=['migrate-question-category'])
+        self.assertIn('1 invalid categories cleared', result.output)
+        db.session.expire_all()
+        self.assertEqual(Question.query.get(kept.id).category, category.id)
+        self.assertIsNone(Question.query.get(orphan.id).category)
+
+    def test_api_rejects_invalid_bundle_size(self):
+        res = self.client.post('/api/questions/play/batch',
+                               json={"category": "click", "questions": 0})
+        self.assertEqual(res.status_code, 400)
+
+    def test_api_rejects_quizzes_over_the_maximum_length(self):
+        res = self.client.post('/api/quizzes',
+                               json={"category": "click", "questions": 51})
+        self.assertEqual(res.status_code, 422)
+        res = self.client.post('/api/quizzes',
+                               json={"category": "click", "questions": 50})
+        self.assertEqual(res.status_code, 201)
+
+    def test_api_plays_a_quiz_on_the_server(self):
+        category = Category("entertainment")
+        category.insert()
+        for text, answer in [("what is music?", "good sounds"),
+                             ("what is a movie?", "moving pictures")]:
+            Question(text, answer, category.id, 1).insert()
+        data = json.dumps({"category": str(category.id), "questions": 5})
+        res = self.client.post('/api/quizzes', data=data,
+                               content_type="application/json")
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        quiz_url = '/api/quizzes/{}'.format(res_data['quiz_id'])
+        first = res_data['question']
+        guess = first['answer'].split(' ')[0]
+        res = self.client.post(quiz_url + '/answers',
+                               data=json.dumps({"answer": guess}),
+                               content_type="application/json")
+        res_data = json.loads(res.data)
+        self.assertTrue(res_data['correct'])
+        self.assertEqual(res_data['score'], 1)
+        self.assertNotEqual(res_data['question']['id'], first['id'])
+        res = self.client.post(quiz_url + '/answers',
+                               data=json.dumps({"answer": "wrong"}),
+                               content_type="application/json")
+        res_data = json.loads(res.data)
+        self.assertFalse(res_data['correct'])
+        self.assertEqual(res_data['question'], "")
+        res = self.client.get(quiz_url)
+        res_data = json.loads(res.data)
+        self.assertTrue(res_data['finished'])
+        self.assertEqual(res_data['questions_asked'], 2)
+        self.assertEqual(res_data['score'], 1)
+        res = self.client.post(quiz_url + '/answers',
+                               data=json.dumps({"answer": "wrong"}),
+                               content_type="application/json")
+        self.assertEqual(res.status_code, 422)
+
+    def test_api_returns_404_for_unknown_quiz(self):
+        res = self.client.get('/api/quizzes/unknown')
+        self.assertEqual(res.status_code, 404)
+
+    def test_pool_picks_unseen_questions_uniformly(self):
+        pool = Pool(random.Random(0))
+        for question_id in range(10):
+            pool.add(question_id)
+        draws = 14000
+        # Unseen ids right after a run of seen ones used to be favoured
+        for seen in (set(pool.ids[:3]), set(pool.ids[:8])):
+            counts = dict.fromkeys(set(pool.ids) - seen, 0)
+            for _ in range(draws):
+                counts[pool.pick(seen)] += 1
+            expected = draws / len(counts)
+            for count in counts.values():
+                self.assertAlmostEqual(count / expected, 1, delta=0.1)
+        self.assertIsNone(pool.pick(set(pool.ids)))
+
+    def test_api_bulk_imports_and_exports_questions(self):
+        self.app.config['BULK_API_TOKEN'] = 'secret'
+        headers = {'Authorization': 'Bearer secret'}
+        category = Category.query.first()
+        Question("what is soccer?", "it is football", category.id, 1).insert()
+        rows = [
+            {"question": "what is music?", "answer": "good sounds",
+             "category": category.id, "difficulty": 1},
+            {"question": "what is soccer?", "answer": "football",
+             "category": category.id, "difficulty": 1},
+            {"question": "what is music?", "answer": "sounds",
+             "category": category.id, "difficulty": 2},
+            {"question": "", "answer": "nothing",
+             "category": category.id, "difficulty": 1},
+        ]
+        data = "\n".join(json.dumps(row) for row in rows) + "\nnot json\n"
+        res = self.client.post('/api/questions/bulk', data=data,
+                               headers=headers,
+                               content_type="application/x-ndjson")
+        res_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res_data['inserted'], 1)
+        self.assertEqual(res_data['duplicates'], 2)
+        self.assertEqual(res_data['rejected'], 2)
+        self.assertEqual(res_data['errors'][0]['line'], 4)
+        csv_data = "question,answer,category,difficulty\n" \
+                   "what is a movie?,moving pictures,{},3\n"\
+                   .format(category.id)
+        res = self.client.post('/api/questions/bulk', data=csv_data,
+                               headers=headers, content_type="text/csv")
+        self.assertEqual(json.loads(res.data)['inserted'], 1)
+        res = self.client.get('/api/questions')
+        self.assertEqual(json.loads(res.data)['total_questions'], 3)
+        res = self.client.get('/api/questions/export', headers=headers)
+        lines = res.data.decode().splitlines()
+        self.assertEqual(res.content_type, 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['question'] for line in lines],
+                         ["what is soccer?", "what is music?",
+                          "what is a movie?"])
+
+    def test_api_bulk_endpoints_require_a_token(self):
+        res = self.client.get('/api/questions/export')
+        self.assertEqual(res.status_code, 403)
+        self.app.config['BULK_API_TOKEN'] = 'secret'
+        res = self.client.post('/api/questions/bulk', data="",
+                               headers={'Authorization': 'Bearer wrong'},
+                               content_type="application/x-ndjson")
+        self.assertEqual(res.status_code, 401)
+        self.assertFalse(json.loads(res.data)['success'])
 
 
 # Make the tests conveniently executable
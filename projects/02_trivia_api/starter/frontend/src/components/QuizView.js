@@ -11,6 +11,7 @@ class QuizView extends Component {
     this.state = {
         quizCategory: "",
         previousQuestions: [], 
+        questionBundle: [],
         showAnswer: false,
         categories: [],
         numCorrect: 0,
@@ -36,48 +37,54 @@ class QuizView extends Component {
   }
 
   selectCategory = ({type}) => {
-    this.setState({quizCategory: type}, this.getNextQuestion)
+    this.setState({quizCategory: type}, this.getQuestionBundle)
   }
 
   handleChange = (event) => {
     this.setState({[event.target.name]: event.target.value})
   }
 
-  getNextQuestion = () => {
-    const previousQuestions = [...this.state.previousQuestions]
-    if(this.state.currentQuestion.question) { previousQuestions.push(this.state.currentQuestion.question) }
-
+  getQuestionBundle = () => {
     $.ajax({
-      url: '/api/questions/play', //TODO: update request URL
+      url: '/api/questions/play/batch', //TODO: update request URL
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
       data: JSON.stringify({
-        previous_questions: previousQuestions,
-        category: String(this.state.quizCategory)
+        previous_questions: this.state.previousQuestions,
+        category: String(this.state.quizCategory),
+        questions: questionsPerPlay
       }),
       xhrFields: {
         withCredentials: true
       },
       crossDomain: true,
       success: (result) => {
-        console.log(this.state.quizCategory)
-        this.setState({
-          showAnswer: false,
-          previousQuestions: previousQuestions,
-          currentQuestion: result.question,
-          guess: '',
-          forceEnd: result.question ? false : true
-        })
+        this.setState({ questionBundle: result.questions }, this.getNextQuestion)
         return;
       },
       error: (error) => {
-        alert('Unable to load question. Please try your request again')
+        alert('Unable to load questions. Please try your request again')
         return;
       }
     })
   }
 
+  getNextQuestion = () => {
+    const previousQuestions = [...this.state.previousQuestions]
+    if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
+    const [nextQuestion, ...questionBundle] = this.state.questionBundle
+
+    this.setState({
+      showAnswer: false,
+      previousQuestions: previousQuestions,
+      questionBundle: questionBundle,
+      currentQuestion: nextQuestion || {},
+      guess: '',
+      forceEnd: nextQuestion ? false : true
+    })
+  }
+
   submitGuess = (event) => {
     event.preventDefault();
     const formatGuess = this.state.guess.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()]/g,"").toLowerCase()
@@ -92,6 +99,7 @@ class QuizView extends Component {
     this.setState({
       quizCategory: "",
       previousQuestions: [], 
+      questionBundle: [],
       showAnswer: false,
       numCorrect: 0,
       currentQuestion: {},
@@ -76,11 +76,9 @@ def add_drink():
                         "error": 
                             "Recipe field must contain a list of recipe objects e.g [{'color': 'blue'}]"}), 400
     drink = Drink(title=title, recipe=recipe)
-    check_drink = Drink.query.filter_by(title=drink.title).first()
-    if check_drink:
+    if not drink.insert_unique():
         return jsonify({"success": False,
-                        "error": f"Drink with title {drink.title} already exists"}), 400
-    drink.insert()
+                        "error": f"Drink with title {title} already exists"}), 400
     return jsonify({"success": True, "drink": drink.long_rep()}), 201
 
 
@@ -1,6 +1,7 @@
 import os
 from sqlalchemy import Column, String, Integer
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 import json
 
 database_filename = "database.db"
@@ -12,8 +13,9 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    database_path may be "sqlite://" for an in-memory database, e.g. in tests
 '''
-def setup_db(app):
+def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
@@ -29,6 +31,14 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+is_unique_violation(error)
+    tells whether an IntegrityError was raised by a unique constraint,
+    which sqlite only names in the error message
+'''
+def is_unique_violation(error):
+    return str(getattr(error, 'orig', '')).startswith('UNIQUE constraint failed')
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -78,6 +88,28 @@ class Drink(db.Model):
         db.session.add(self)
         db.session.commit()
 
+    '''
+    insert_unique()
+        inserts a new model into a database unless one with the same
+        title exists, letting the unique constraint detect the clash
+        instead of looking the title up first
+        returns False if the title is taken
+        EXAMPLE
+            drink = Drink(title=req_title, recipe=req_recipe)
+            if not drink.insert_unique():
+                ...
+    '''
+    def insert_unique(self):
+        try:
+            db.session.add(self)
+            db.session.commit()
+            return True
+        except IntegrityError as error:
+            db.session.rollback()
+            if is_unique_violation(error):
+                return False
+            raise
+
     '''
     delete()
         deletes a new model into a database
@@ -0,0 +1,34 @@
+import unittest
+from flask import Flask
+
+from src.database.models import setup_db, db, Drink
+
+
+class DrinkTestCase(unittest.TestCase):
+    """This class represents the drink model test case"""
+
+    def setUp(self):
+        """Create an app with an empty in-memory database"""
+        self.app = Flask(__name__)
+        setup_db(self.app, 'sqlite://')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_insert_unique_rejects_duplicate_titles(self):
+        recipe = [{'color': 'brown', 'name': 'coffee', 'parts': 1}]
+        self.assertTrue(Drink(title='Latte', recipe=recipe).insert_unique())
+        self.assertFalse(Drink(title='Latte', recipe=recipe).insert_unique())
+        self.assertTrue(Drink(title='Mocha', recipe=recipe).insert_unique())
+        self.assertEqual(Drink.query.count(), 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,6 @@
 from flask import request, jsonify, abort, make_response
-from models import Question, Answer
-from utilities import abort_func, validate_field
+from models import Question, Answer, unit_of_work
+from utilities import abort_func, validate_field, wants_stream, stream_ndjson
 
 
 class QuestionController:
@@ -19,13 +19,11 @@ class QuestionController:
         teacher_id = data.get("teacher_id")
         validate_field(question, "question")
         validate_field(teacher_id, "teacher_id")
-        qn = Question.query.filter_by(question=question).first()
-        if qn:
-            abort_func(400, 
-                    f"Question {qn.question}already exists",
-                    False)
         qn_obj = Question(question=question, teacher_id=teacher_id)
-        qn_obj.save()
+        if not qn_obj.save_unique():
+            abort_func(400,
+                       f"Question {question}already exists",
+                       False)
         return jsonify({
             "message": "Question was created successfully",
             "success": True
@@ -37,18 +35,21 @@ class QuestionController:
         teacher_id = data.get("teacher_id")
         qtn = Question.query.filter_by(id=question_id).first()
         self.check_question_exists(qtn)
-        if question:
-            setattr(qtn, 'question', question)
-            qtn.edit()
-        if teacher_id:
-            setattr(qtn, 'teacher_id', teacher_id)
-            qtn.edit()
+        with unit_of_work():
+            if question:
+                setattr(qtn, 'question', question)
+                qtn.edit()
+            if teacher_id:
+                setattr(qtn, 'teacher_id', teacher_id)
+                qtn.edit()
         return jsonify({
             "message": "update successful",
             "success": True
             }), 202
 
     def get_questions(self):
+        if wants_stream():
+            return stream_ndjson(Question.query.order_by(Question.id))
         qtns = Question.query.all()
         if not qtns:
             abort_func(404,
@@ -102,6 +103,8 @@ class AnswerController:
             }), 201
        
     def get_answers(self, question_id):
+        if wants_stream():
+            return stream_ndjson(Answer.query.order_by(Answer.id))
         answers = Answer.query.all()
         if not answers:
             abort_func(404,
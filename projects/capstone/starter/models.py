@@ -1,15 +1,53 @@
+from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 # from flask import current_app as app
 
 
 db = SQLAlchemy()
 
+UNIT_OF_WORK_KEY = 'unit_of_work_depth'
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Groups every save, edit and delete made inside the block into one
+    transaction that is committed when the outermost block exits, or
+    rolled back if it raises. Can also be used as a decorator.
+    """
+    session = db.session()
+    depth = session.info.get(UNIT_OF_WORK_KEY, 0)
+    session.info[UNIT_OF_WORK_KEY] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info[UNIT_OF_WORK_KEY] = depth
+
+
+def in_unit_of_work():
+    return db.session().info.get(UNIT_OF_WORK_KEY, 0) > 0
+
+
+def is_unique_violation(error):
+    # unique_violation, as reported by psycopg2
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == '23505'
+
 
 class BaseModel(db.Model):
     __abstract__ = True
     id = db.Column(db.Integer, primary_key=True)
     
     def save(self):
+        if in_unit_of_work():
+            db.session.add(self)
+            return
         try:
             db.session.add(self)
             db.session.commit()
@@ -19,7 +57,33 @@ class BaseModel(db.Model):
         finally:
             db.session.close()
 
+    def save_unique(self):
+        """
+        Saves a new row, relying on the table's unique constraints to
+        detect duplicates. Returns False if a matching row already exists.
+        """
+        session = db.session()
+        try:
+            if in_unit_of_work():
+                with session.begin_nested():
+                    session.add(self)
+                return True
+            session.add(self)
+            session.commit()
+            return True
+        except IntegrityError as error:
+            if not in_unit_of_work():
+                session.rollback()
+            if is_unique_violation(error):
+                return False
+            raise
+        finally:
+            if not in_unit_of_work():
+                session.close()
+
     def edit(self):
+        if in_unit_of_work():
+            return
         try:
             db.session.commit()
         except:
@@ -29,6 +93,9 @@ class BaseModel(db.Model):
             db.session.close()
             
     def delete(self):
+        if in_unit_of_work():
+            db.session.delete(self)
+            return
         try:
             db.session.delete(self)
             db.session.commit()
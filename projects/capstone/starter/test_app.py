@@ -1,7 +1,7 @@
 import os
 import unittest
 import json
-from models import db
+from models import db, Question, unit_of_work
 from app import create_app
 
 
@@ -66,3 +66,49 @@ class CapstoneTestCase(unittest.TestCase):
         data = json.loads(r.data)
         print(data)
         self.assertEqual(data["error"], "Permission not found.")
+
+
+    def test_unit_of_work_commits_saves_together(self):
+        with self.app.app_context():
+            with unit_of_work():
+                Question(question='What is flask?', teacher_id='12').save()
+                Question(question='What is sql?', teacher_id='12').save()
+                self.assertEqual(Question.query.count(), 2)
+            self.assertEqual(Question.query.count(), 2)
+
+
+    def test_unit_of_work_rolls_back_failed_batch(self):
+        with self.app.app_context():
+            with self.assertRaises(Exception):
+                with unit_of_work():
+                    Question(question='What is flask?', teacher_id='12').save()
+                    Question(question='What is flask?', teacher_id='13').save()
+            self.assertEqual(Question.query.count(), 0)
+
+
+    def test_api_rejects_duplicate_question(self):
+        headers = {"Authorization":"Bearer {}".format(self.teacher_token)}
+        self.client.post('/questions', json=self.question, headers=headers)
+        response = self.client.post('/questions', json=self.question, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        with self.app.app_context():
+            self.assertEqual(Question.query.count(), 1)
+
+
+    def test_save_unique_skips_duplicates_inside_unit_of_work(self):
+        with self.app.app_context():
+            with unit_of_work():
+                self.assertTrue(Question(question='What is flask?', teacher_id='12').save_unique())
+                self.assertFalse(Question(question='What is flask?', teacher_id='13').save_unique())
+                self.assertTrue(Question(question='What is sql?', teacher_id='12').save_unique())
+            self.assertEqual(Question.query.count(), 2)
+
+
+    def test_api_streams_questions_as_ndjson(self):
+        headers = {"Authorization":"Bearer {}".format(self.teacher_token),
+                   "Accept": "application/x-ndjson"}
+        self.client.post('/questions', json=self.question, headers=headers)
+        response = self.client.get('/questions', headers=headers)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual(lines[0]["question"], "What is python?")
@@ -1,4 +1,9 @@
-from flask import abort, make_response, jsonify
+import json
+from flask import (abort, make_response, jsonify, request, Response,
+                   stream_with_context)
+
+NDJSON = 'application/x-ndjson'
+STREAM_BATCH_SIZE = 500
 
 
 def abort_func(status_code, message, success_state):
@@ -14,3 +19,19 @@ def validate_field(field, field_name):
         return abort_func(400,
                           f"{field_name} field is missing or empty",
                           False)
+
+
+def wants_stream():
+    if request.args.get('stream') == '1':
+        return True
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON]) == NDJSON
+
+
+def stream_ndjson(query):
+    """Writes each row's format() as a line of JSON while the rows are
+    fetched, STREAM_BATCH_SIZE at a time"""
+    def generate():
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            yield json.dumps(row.format()) + "\n"
+    return Response(stream_with_context(generate()), mimetype=NDJSON)